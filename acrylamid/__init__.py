@@ -32,8 +32,7 @@ import signal
 
 from optparse import OptionParser, make_option, SUPPRESS_HELP
 from textwrap import fill
-from acrylamid import defaults, log, commands
-from acrylamid.tasks import get_tasks
+from acrylamid import defaults, log
 from acrylamid.errors import AcrylamidException
 
 signal.signal(signal.SIGINT, signal.SIG_DFL)
@@ -129,14 +128,16 @@ class Acryl:
             epilog = fill(epilog)+'\n'
         # --- gen params --- #
         elif sys.argv[1] in ('compile', 'co', 'generate', 'gen'):
-            usage = "%prog " + sys.argv[1] + " [-fn]"
+            usage = "%prog " + sys.argv[1] + " [-fnj] [FILE|URL ...]"
             options = [
                 make_option("-f", "--force", action="store_true", dest="force",
                             help="clear cache before compilation", default=False),
                 make_option("-n", "--dry-run", dest="dryrun", action='store_true',
                             default=False, help="show what would have been compiled"),
                 make_option("-i", "--ignore", dest="ignore", action="store_true",
-                            default=False, help="ignore critical errors")
+                            default=False, help="ignore critical errors"),
+                make_option("-j", "--jobs", dest="jobs", type=int, default=None,
+                            help="compute filters in N processes")
             ]
         # --- webserver params --- #
         elif sys.argv[1] in ('view', 'serve', 'srv'):
@@ -153,6 +154,8 @@ class Acryl:
                             help="clear cache before compilation", default=False),
                 make_option("-i", "--ignore", dest="ignore", action="store_true",
                             default=False, help="ignore critical errors"),
+                make_option("-j", "--jobs", dest="jobs", type=int, default=None,
+                            help="compute filters in N processes"),
                 make_option("-p", "--port", dest="port", type=int, default=8000,
                             help="webserver port"),
             ]
@@ -167,6 +170,7 @@ class Acryl:
             ]
 
         else:
+            from acrylamid.tasks import get_tasks
             tasks = get_tasks()
             if sys.argv[1] in tasks:
                 usage = tasks[sys.argv[1]].usage
@@ -230,11 +234,12 @@ class Acryl:
         conf.update(dict((k, v) for k, v in options.__dict__.iteritems() if v != None))
 
         # -- run -- #
+        from acrylamid import commands
 
         if args[0] in ('gen', 'generate', 'co', 'compile'):
             log.setLevel(options.verbosity-5)
             try:
-                commands.compile(conf, env, **options.__dict__)
+                commands.compile(conf, env, targets=args[1:], **options.__dict__)
             except AcrylamidException as e:
                 log.fatal(e.message)
                 sys.exit(1)
@@ -12,18 +12,18 @@ import codecs
 import tempfile
 import subprocess
 
-from os.path import join, dirname, getmtime, isfile
+from os.path import join, dirname, getmtime, isfile, exists, abspath, relpath
+from itertools import chain
+from collections import deque
 from urlparse import urlsplit
 from datetime import datetime
-from jinja2 import Environment, FileSystemBytecodeCache
 
 from acrylamid import log
 from acrylamid.errors import AcrylamidException
 
-from acrylamid import filters, views, utils, helpers
-from acrylamid.lib.importer import fetch, parse, build
-from acrylamid.core import cache, ExtendedFileSystemLoader
-from acrylamid.helpers import event, escape, FileEntry
+# Subcommands import what they need on their own, thus `acrylamid deploy` or
+# `acrylamid new` do not load Jinja2, the importer, filters or views.  Within a
+# compilation each of these imports is a lookup in sys.modules.
 
 
 def initialize(conf, env):
@@ -31,8 +31,23 @@ def initialize(conf, env):
     some minor things. Filter and View are inited with conf and env,
     a request dict is returned.
     """
+    from jinja2 import Environment, FileSystemBytecodeCache
+
+    from acrylamid import filters, views, helpers
+    from acrylamid.core import cache
+    from acrylamid.templates import ExtendedFileSystemLoader
+
+    # a quarter of MEMORY_BUDGET for decoded and for queued cache values
+    memory, budget = conf.get('cache_memory', None), conf.get('memory_budget', 0) // 4
+    if budget:
+        memory = min(memory or cache.memory.capacity, budget)
+
     # initialize cache, optional to cache_dir
-    cache.init(conf.get('cache_dir', None))
+    cache.init(conf.get('cache_dir', None), codec=conf.get('cache_codec', None),
+               threshold=conf.get('cache_codec_threshold', None),
+               max_size=conf.get('cache_max_size', None),
+               memory=memory, write_behind=conf.get('cache_write_behind', None),
+               max_pending=budget)
 
     # set up templating environment
     env['jinja2'] = Environment(loader=ExtendedFileSystemLoader(conf['layout_dir']),
@@ -89,7 +104,176 @@ def initialize(conf, env):
     return {'conf': conf, 'env': env}
 
 
-def compile(conf, env, force=False, **options):
+# entries of the current compilation, inherited by forked worker processes
+_entrylist = []
+
+
+def _prerender(job):
+    """Worker process: compute the filter chains of a single entry and return
+    the collected cache records."""
+
+    from acrylamid.core import cache
+
+    i, contexts = job
+    entry = _entrylist[i]
+
+    for context in contexts:
+        entry.context = context
+        entry.content
+
+    batch = list(cache.queue)
+    del cache.queue[:]
+    return i, batch
+
+
+def prerender(entrylist, views, jobs):
+    """Compute every entry's missing filter chain outputs for all views in `jobs`
+    worker processes.  Workers never write to the cache, their results are
+    merged into the pack by this process, thus rendering afterwards reads the
+    cache only.  Entries computed here are marked as changed."""
+
+    import multiprocessing
+    from acrylamid.core import cache
+
+    global _entrylist
+
+    todo = []
+    for i, entry in enumerate(entrylist):
+        path = join(cache.cache_dir, entry.md5)
+        contexts = []
+        for context in set(v.__class__.__name__ for v in views if v.condition(entry)):
+            steps = entry.steps(context)
+            if steps and steps[-1][1] not in cache.objects.get(path, ()):
+                contexts.append(context)
+        if contexts:
+            todo.append((i, contexts))
+
+    if len(todo) < 2:
+        return
+
+    _entrylist = entrylist
+    cache.flush()
+
+    pool = multiprocessing.Pool(min(jobs, len(todo)), initializer=cache.detach)
+    try:
+        for i, batch in pool.imap_unordered(_prerender, todo):
+            cache.merge(batch)
+            if batch:
+                entrylist[i].has_changed = True
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        _entrylist = []
+
+    log.debug('prerendered %i entries in %i processes' % (len(todo), jobs))
+
+
+def _render(html):
+    """Render a page if necessary and return (html, rendering time)."""
+
+    ctime = time.time()
+    if callable(html):
+        html = html()
+    return html, time.time() - ctime
+
+
+def render(pages, pool=None, ahead=32):
+    """Render (html, path) pairs yielded by :meth:`View.generate` where html is
+    either a string or a callable returning the page.  With a thread `pool`
+    up to `ahead` pages render concurrently, but are yielded in order as
+    (html, path, ctime)."""
+
+    if pool is None:
+        for html, path in pages:
+            html, ctime = _render(html)
+            yield html, path, ctime
+        return
+
+    queue = deque()
+    for html, path in pages:
+        queue.append((pool.apply_async(_render, (html, )), path))
+        while queue and (queue[0][0].ready() or len(queue) > ahead):
+            res, path = queue.popleft()
+            html, ctime = res.get()
+            yield html, path, ctime
+
+    while queue:
+        res, path = queue.popleft()
+        html, ctime = res.get()
+        yield html, path, ctime
+
+
+def plan(signature, ns, chains):
+    """Return the filter chain of `signature`, the filter names of an entry, a
+    view and conf.py in that order, resolved by `ns` (name -> filter).  Each
+    signature is planned only once and the chain is shared by all entries and
+    views using it (via `chains`)."""
+
+    from acrylamid.filters import FilterList
+
+    try:
+        return chains[signature]
+    except KeyError:
+        pass
+
+    # a list that sorts out conflicting and duplicated filters
+    flst = FilterList()
+    for fn in signature:
+        if ns[fn] not in flst:
+            flst.append(ns[fn])
+
+    chains[signature] = sorted(flst, key=lambda k: (-k.priority, k.name))
+    return chains[signature]
+
+
+def select(conf, entrylist, targets):
+    """Resolve entry filenames, URLs and output paths to a tuple of entry
+    filenames and output paths, see :attr:`helpers.graph.targets`."""
+
+    from acrylamid.helpers import joinurl
+
+    files, paths = set([]), set([])
+    filenames = dict((abspath(e.filename), e) for e in entrylist)
+    permalinks = dict((e.permalink, e) for e in entrylist)
+
+    for target in targets:
+        if abspath(target) in filenames:
+            files.add(filenames[abspath(target)].filename)
+            continue
+
+        url = target
+        if abspath(target).startswith(abspath(conf['output_dir'])):
+            url = relpath(target, conf['output_dir'])
+        if url.endswith('index.html'):
+            url = url[:-len('index.html')]
+        url = joinurl('/', url)
+
+        # trailing slashes are optional
+        links = [link for link in (url, url.rstrip('/') + '/') if link in permalinks]
+        if links:
+            files.add(permalinks[links[0]].filename)
+            continue
+
+        path = joinurl(conf['output_dir'], url)
+        if path.endswith('/'):
+            path = joinurl(path, 'index.html')
+        if not exists(path):
+            raise AcrylamidException('no such entry or page: %r' % target)
+        paths.add(path)
+
+    return files, paths
+
+
+def compile(conf, env, force=False, targets=[], **options):
+
+    from multiprocessing.pool import ThreadPool
+
+    from acrylamid import filters, views, utils, helpers
+    from acrylamid.core import cache
+    from acrylamid.helpers import graph, FileEntry
 
     # time measurement
     ctime = time.time()
@@ -107,7 +291,7 @@ def compile(conf, env, force=False, **options):
                        key=lambda k: k.date, reverse=True)
 
     # here we store all possible filter configurations
-    ns = set()
+    ns = {}
 
     # get available filter list, something like with obj.get-function
     # list = [<class head_offset.Headoffset at 0x1014882c0>, <class html.HTML at 0x101488328>,...]
@@ -117,7 +301,7 @@ def compile(conf, env, force=False, **options):
     _views = views.get_views()
 
     # filters found in all entries, views and conf.py
-    found = sum((x.filters for x in entrylist+_views), []) + request['conf']['filters']
+    found = sorted(set(chain(request['conf']['filters'], *(x.filters[:] for x in entrylist+_views))))
 
     for val in found:
         # first we for `no` and get the function name and arguments
@@ -136,31 +320,44 @@ def compile(conf, env, force=False, **options):
             except ValueError:
                 raise AcrylamidException('no such filter: %s' % val)
 
-        ns.add(fx)
+        ns[val] = fx
 
+    # entries with identical filters share their filter tree
+    trees = {}
     for entry in entrylist:
-        for v in _views:
+        entry.filters = trees.setdefault(tuple(entry.filters[:]), entry.filters)
 
-            # a list that sorts out conflicting and duplicated filters
-            flst = filters.FilterList()
-
-            # filters found in this specific entry plus views and conf.py
-            found = entry.filters + v.filters + request['conf']['filters']
+    # filters found in these entries plus views and conf.py, planned once
+    chains = {}
+    for tree in trees.itervalues():
+        for v in _views:
+            signature = tuple(tree + v.filters + request['conf']['filters'])
+            tree.add(plan(signature, ns, chains), context=v.__class__.__name__)
 
-            for fn in found:
-                fx = filter(lambda k: fn == k.name, ns)[0]
-                if fx not in flst:
-                    flst.append(fx)
+    # acrylamid compile FILE|URL ... rebuilds only pages containing those
+    graph.targets = select(conf, entrylist, targets) if targets else None
 
-            # sort them ascending because we will pop within filters.add
-            entry.filters.add(sorted(flst, key=lambda k: (-k.priority, k.name)),
-                              context=v.__class__.__name__)
+    # compute filter chains in parallel, -j/--jobs or JOBS in conf.py
+    if conf.get('jobs', 1) > 1:
+        prerender([e for e in entrylist if graph.targets is None
+                   or e.filename in graph.targets[0]], _views, conf['jobs'])
 
     # lets offer a last break to populate tags or so
     # XXX this API component needs a review
     for v in _views:
         env = v.context(env, {'entrylist': filter(v.condition, entrylist)})
 
+    # render pages of a view concurrently, see RENDER_THREADS in conf.py; the
+    # threads share the cache, which guards its in-memory LRU with cache.lock
+    pool = ThreadPool(conf['render_threads']) if conf.get('render_threads', 1) > 1 else None
+
+    # write files in background threads, see WRITE_THREADS in conf.py
+    budget = conf.get('memory_budget', 0) // 4 or None
+    writer = helpers.Writer(conf.get('write_threads', 0), budget=budget, **options)
+
+    # with a MEMORY_BUDGET, render no more pages ahead than in parallel
+    ahead = conf.get('render_threads', 1) if budget else 32
+
     # now teh real thing!
     for v in _views:
 
@@ -171,14 +368,21 @@ def compile(conf, env, force=False, **options):
             entry.context = v.__class__.__name__
 
         request['entrylist'] = filter(v.condition, entrylist)
-        tt = time.time()
 
-        for html, path in v.generate(request):
-            helpers.mkfile(html, path, time.time()-tt, **options)
-            tt = time.time()
+        for html, path, rtime in render(v.generate(request), pool, ahead):
+            writer.put(html, path, rtime)
+
+        # views may depend on previous output, e.g. the sitemap
+        writer.wait()
+
+    writer.close()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
 
     # remove abandoned cache files
-    cache.shutdown()
+    cache.shutdown(partial=bool(targets))
 
     log.info('Blog compiled in %.2fs' % (time.time() - ctime))
 
@@ -187,6 +391,8 @@ def autocompile(conf, env, **options):
     """Subcommand: autocompile -- automatically re-compiles when something in
     content-dir has changed and parallel serving files."""
 
+    from acrylamid import utils
+
     mtime = -1
 
     while True:
@@ -206,6 +412,8 @@ def new(conf, env, title, prompt=True):
     ``acrylamid new My fresh new Entry`` or interactively via ``acrylamid new``
     and the file will be created using the preferred permalink format."""
 
+    from acrylamid.helpers import event, escape, FileEntry
+
     fd, tmp = tempfile.mkstemp(suffix='.txt', dir='.cache/')
     editor = os.getenv('VISUAL') if os.getenv('VISUAL') else os.getenv('EDITOR')
 
@@ -268,6 +476,8 @@ def importer(conf, env, url, **options):
 
     If you don't like any reconversion, simply use ``--format=html``."""
 
+    from acrylamid.lib.importer import fetch, parse, build
+
     content = fetch(url, auth=options.get('auth', None))
     defaults, items = parse(content)
     build(conf, env, defaults, items, fmt=options['import_fmt'], keep=options['keep_links'])
@@ -5,84 +5,65 @@
 
 import os
 import io
+import time
 import zlib
+import struct
 import tempfile
+import threading
+
+from Queue import Queue, Empty
 
 from collections import defaultdict
-from os.path import join, exists, getmtime
+from os.path import join, exists, basename
 
 from acrylamid import log
 from acrylamid.errors import AcrylamidException
-from acrylamid.utils import memoized
-
-from jinja2 import FileSystemLoader, meta
+from acrylamid.utils import LRU
 
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
+try:
+    import bz2
+except ImportError:
+    bz2 = None
 
-class ExtendedFileSystemLoader(FileSystemLoader):
-
-    # Acrylamid views (should) process templates on the fly thus we
-    # don't have a 1. "select template", 2. "render template" stage
-    resolved = {}
-
-    def load(self, environment, name, globals=None):
-        """patched `load` to add a has_changed property providing information
-        whether the template or its parents have changed."""
-
-        def resolve(parent):
-            """We check whether any dependency (extend-block) has changed and
-            update the bucket -- recursively. Returns True if the template
-            itself or any parent template has changed. Otherwise False."""
-
-            if parent in self.resolved:
-                return self.resolved[parent]
-
-            source, filename, uptodate = self.get_source(environment, parent)
-            bucket = bcc.get_bucket(environment, parent, filename, source)
-            p = bcc._get_cache_filename(bucket)
-            has_changed = getmtime(filename) > getmtime(p) if exists(p) else True
-
-            if has_changed:
-                # updating cached template if timestamp has changed
-                code = environment.compile(source, parent, filename)
-                bucket.code = code
-                bcc.set_bucket(bucket)
 
-                self.resolved[parent] = True
-                return True
+class Memory(dict):
+    """Memoized values, saved in *.cache/info*.  Keys read, written or touched
+    are remembered as used, see :meth:`cache.shutdown`."""
 
-            ast = environment.parse(source)
-            for name in meta.find_referenced_templates(ast):
-                rv = resolve(name)
-                if rv:
-                    # XXX double-return to break this recursion?
-                    return True
+    def __init__(self, *args, **kwargs):
+        super(Memory, self).__init__(*args, **kwargs)
+        self.used = set([])
 
-        if globals is None:
-            globals = {}
+    def __call__(self, k, v=None):
+        self.used.add(k)
+        if v:
+            self[k] = v
+        else:
+            return self.get(k, None)
 
-        source, filename, uptodate = self.get_source(environment, name)
+    def touch(self, *keys):
+        self.used.update(keys)
 
-        bcc = environment.bytecode_cache
-        bucket = bcc.get_bucket(environment, name, filename, source)
-        has_changed = bool(resolve(name))
 
-        code = bucket.code
-        if code is None:
-            code = environment.compile(source, name, filename)
+class Batch(list):
+    """Stands in for the write-behind queue in a forked process and collects
+    new records to be merged by the parent process, see :meth:`cache.detach`."""
 
-        tt = environment.template_class.from_code(environment, code, globals, uptodate)
-        tt.has_changed = has_changed
-        return tt
+    put = list.append
+    empty = lambda self: not self
 
 
-class Memory(dict):
+def ExtendedFileSystemLoader(*args, **kwargs):
+    """Deprecated, use :class:`acrylamid.templates.ExtendedFileSystemLoader`.
+    Kept as a factory, importing Jinja2 on first use only."""
 
-    __call__ = lambda self, k, v=None: self.__setitem__(k, v) if v else self.get(k, None)
+    from acrylamid.templates import ExtendedFileSystemLoader
+    return ExtendedFileSystemLoader(*args, **kwargs)
 
 
 def track(f):
@@ -99,9 +80,27 @@ def track(f):
 
 
 class cache(object):
-    """A cache that stores the entries on the file system.  Borrowed from
-    werkzeug.contrib.cache, see their AUTHORS and LICENSE for additional
-    copyright information.
+    """A cache that stores all intermediates in a single, append-only pack file.
+    Inspired by werkzeug.contrib.cache, see their AUTHORS and LICENSE for
+    additional copyright information.
+
+    Each value is written as a self-describing record (header with the cache
+    object's name, its key, a timestamp, the codec and whether it is the final
+    output of a filter chain followed by the encoded blob) to the end of
+    *.cache/pack*.  An in-memory index maps each (path, key) to the
+    blob's offset and size, so `get` costs one seek and one read and `set`
+    appends a single record.  The index is rebuilt on `init` by skipping from
+    header to header only if the manifest *.cache/manifest* (written on
+    `shutdown`) is missing or corrupt.
+
+    With `write_behind`, new values are queued and appended to the pack by a
+    background thread (or in a single batch on `shutdown`), in the meantime
+    they are served from memory.  Once queued values exceed `max_pending`
+    bytes, they are flushed.
+
+    Decoded values are kept in a bounded, in-memory LRU (`cache.memory`) in front
+    of the pack, thus repeated access of the same intermediate during a
+    compilation costs a dictionary lookup.
 
     This version is a bit more advanced and can track used cache objects to
     remove them, it reduces I/O so we can call `has_key` very often. After
@@ -126,117 +125,415 @@ class cache(object):
     cache_dir = '.cache/'
     mode = 0600
 
+    # record header: length of pickled (name, key, stamp, codec, final) and
+    # length of blob
+    _header = struct.Struct('!HI')
+    _version = 2
+    _pack = None
+
     tracked = defaultdict(set)
     objects = defaultdict(set)
 
+    # path -> {key: (offset, size, stamp, codec, final, atime)}
+    index = defaultdict(dict)
+
+    # size of abandoned blobs in the pack and the ratio when to compact
+    garbage = 0
+    gc_ratio = 0.5
+
+    # keep unused intermediates up to this size (in bytes), see `shutdown`
+    max_size = None
+    started = 0.0
+
+    # index has changed during this run
+    dirty = False
+
+    # codec name -> (encode, decode), values smaller than threshold are stored raw
+    codecs = {
+        'raw': (lambda s: s, lambda s: s),
+        'zlib': (lambda s: zlib.compress(s, 6), zlib.decompress),
+        'zlib1': (lambda s: zlib.compress(s, 1), zlib.decompress),
+        'zlib9': (lambda s: zlib.compress(s, 9), zlib.decompress),
+    }
+    if bz2:
+        codecs['bz2'] = (bz2.compress, bz2.decompress)
+
+    codec = 'zlib'
+    threshold = 0
+
+    # (path, key) -> decoded value of recently used intermediates
+    memory = LRU(capacity=8*1024**2)
+
+    # False, True (background thread) or 'shutdown' (single batch), values not
+    # yet written are kept in pending, pack and index are guarded by lock
+    write_behind = False
+    queue = writer = None
+    pending = {}
+    lock = threading.RLock()
+
+    # size of queued blobs, they are flushed if it exceeds max_pending (bytes)
+    backlog = 0
+    max_pending = None
+
     memoize = Memory()
+    _memoized = {}
 
     @classmethod
     def _list_dir(self):
-        """return a list of (fully qualified) cache filenames"""
+        """return a list of (fully qualified) cache filenames from the previous,
+        one-pickle-per-entry layout."""
         return [join(self.cache_dir, fn) for fn in os.listdir(self.cache_dir)
-                if not fn.endswith('.cache')]
+                if len(fn) == 32 and not fn.strip('0123456789abcdef')]
+
+    @classmethod
+    def _open(self):
+        """(re)open pack file for appending and random reads."""
+        if self._pack is not None:
+            self._pack.close()
+
+        path = join(self.cache_dir, 'pack')
+        self._pack = io.open(path, 'a+b')
+        os.chmod(path, self.mode)
+
+    @classmethod
+    def _scan(self, offset=0):
+        """Rebuild index from pack file, starting at `offset`.  A truncated
+        trailing record (e.g. from a killed process) is cut off."""
+
+        fp = self._pack
+        fp.seek(0, os.SEEK_END)
+        end = fp.tell()
+        fp.seek(offset)
+
+        while offset < end:
+            try:
+                hlen, size = self._header.unpack(fp.read(self._header.size))
+                name, key, stamp, codec, final = pickle.loads(fp.read(hlen))
+            except (struct.error, pickle.PickleError, EOFError, ValueError):
+                break
+
+            pos = offset + self._header.size + hlen
+            if pos + size > end:
+                break
+
+            path = join(self.cache_dir, name)
+            if key in self.index[path]:
+                self.garbage += self.index[path][key][1]
+            self.index[path][key] = (pos, size, stamp, codec, final, stamp)
+            self.objects[path].add(key)
+
+            offset = pos + size
+            fp.seek(offset)
+            self.dirty = True
+
+        if offset < end:
+            log.debug('truncate pack file at %i bytes' % offset)
+            fp.truncate(offset)
 
     @classmethod
-    def init(self, cache_dir=None, mode=0600):
+    def _load(self):
+        """Load index from manifest in a single read.  Records appended after
+        the manifest has been written (e.g. an interrupted compile) are read
+        from the pack.  Returns False if the manifest is missing or corrupt."""
+
+        try:
+            with io.open(join(self.cache_dir, 'manifest'), 'rb') as fp:
+                version, covered, garbage, objects = pickle.load(fp)
+        except (IOError, pickle.PickleError, EOFError, ValueError, TypeError):
+            return False
+
+        if version != self._version:
+            return False
+
+        self._pack.seek(0, os.SEEK_END)
+        if self._pack.tell() < covered:
+            return False
+
+        for name, keys in objects.iteritems():
+            path = join(self.cache_dir, name)
+            self.index[path] = keys
+            self.objects[path] = set(keys)
+
+        self.garbage = garbage
+        self._scan(covered)
+        return True
+
+    @classmethod
+    def _dump(self):
+        """Write manifest, a mapping of each cache object to its keys and their
+        index entry -- covering the pack up to its current size -- and the amount
+        of garbage in the pack."""
+
+        self._pack.seek(0, os.SEEK_END)
+        covered = self._pack.tell()
+        objects = dict((basename(path), keys) for path, keys in self.index.iteritems()
+                       if keys)
+
+        try:
+            fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
+                                       dir=self.cache_dir)
+            with io.open(fd, 'wb') as fp:
+                pickle.dump((self._version, covered, self.garbage, objects), fp,
+                            pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, join(self.cache_dir, 'manifest'))
+        except (IOError, OSError, pickle.PickleError) as e:
+            log.warn('%s: %s' % (e.__class__.__name__, e))
+        else:
+            self.dirty = False
+
+    @classmethod
+    def _read(self, path, key):
+        offset, size = self.index[path][key][:2]
+        self._pack.seek(offset)
+        blob = self._pack.read(size)
+        if len(blob) != size:
+            raise IOError('unexpected end of pack file')
+        return blob
+
+    @classmethod
+    def _write(self, fp, path, key, blob, stamp, codec, final):
+        """Append a record to `fp` and return the blob's offset."""
+        meta = pickle.dumps((basename(path), key, stamp, codec, final),
+                            pickle.HIGHEST_PROTOCOL)
+
+        fp.seek(0, os.SEEK_END)
+        offset = fp.tell() + self._header.size + len(meta)
+        fp.write(self._header.pack(len(meta), len(blob)) + meta + blob)
+        return offset
+
+    @classmethod
+    def init(self, cache_dir=None, mode=0600, codec=None, threshold=None,
+             max_size=None, memory=None, write_behind=None, max_pending=None):
         """
         :param cache_dir: the directory where cache files are stored.
         :param mode: the file mode wanted for the cache files, default 0600
+        :param codec: compression used for new values, see `cache.codecs`
+        :param threshold: store values smaller than this (in bytes) uncompressed
+        :param max_size: size budget (in bytes), keeps unused intermediates
+        :param memory: size (in bytes) of the in-memory LRU of decoded values
+        :param write_behind: queue new values, see `cache.write_behind`
+        :param max_pending: flush queued values exceeding this size (in bytes)
         """
+        if self.queue is not None:
+            self._stop()
+
         if cache_dir:
             self.cache_dir = cache_dir
         if mode:
             self.mode = mode
+        if codec:
+            if codec not in self.codecs:
+                raise AcrylamidException('no such cache codec: %r' % codec)
+            self.codec = codec
+        if threshold is not None:
+            self.threshold = threshold
+        if max_size is not None:
+            self.max_size = max_size or None
+        if memory is not None:
+            self.memory.capacity = memory
+        if write_behind is not None:
+            self.write_behind = write_behind
+        if max_pending is not None:
+            self.max_pending = max_pending or None
         if not exists(self.cache_dir):
             try:
                 os.mkdir(self.cache_dir, 0700)
             except OSError:
                 raise AcrylamidException("could not create directory '%s'" % self.cache_dir)
 
-        # get all cache objects
-        for path in self._list_dir():
-            try:
-                with io.open(path, 'rb') as fp:
-                    self.objects[path] = set(pickle.load(fp).keys())
-            except pickle.PickleError:
+        self.index.clear()
+        self.objects.clear()
+        self.tracked.clear()
+        self.garbage, self.dirty = 0, False
+        self.backlog = 0
+        self.started = time.time()
+        self.memory.clear()
+
+        # remove cache files from previous versions
+        legacy = self._list_dir()
+        if legacy:
+            log.info('notice  invalid cache objects, recompile everything.' \
+                     + ' This may take a while...')
+            for path in legacy:
                 os.remove(path)
-            except AttributeError:
-                # this may happen after a refactor
-                log.info('notice  invalid cache objects, recompile everything.' \
-                         + ' This may take a while...')
-                for obj in self._list_dir():
-                    cache.remove(obj)
-                break
-            except IOError:
-                continue
+
+        # get all cache objects
+        try:
+            self._open()
+            if not self._load():
+                self.index.clear()
+                self.objects.clear()
+                self.garbage, self.dirty = 0, True
+                self._scan()
+        except (IOError, OSError) as e:
+            raise AcrylamidException('unable to read cache: %s' % e)
 
         # load memorized items
+        self.memoize.used.clear()
         try:
             with io.open(join(cache.cache_dir, 'info'), 'rb') as fp:
                 cache.memoize.update(pickle.load(fp))
         except (IOError, pickle.PickleError):
             pass
 
-    @classmethod
-    def shutdown(self):
-        """Remove abandoned cache files that are not accessed during a compilation.
-        This does not affect jinja2 templates or cache's memoize file *.cache/info*.
+        self._memoized = dict(self.memoize)
+
+        if self.write_behind:
+            self.queue = Queue()
+        if self.write_behind and self.write_behind != 'shutdown':
+            self.writer = threading.Thread(target=self._consume, args=(self.queue, ))
+            self.writer.daemon = True
+            self.writer.start()
 
-        This does also remove abandoned intermediates from a cache file (they accumulate
-        over time)."""
+    @classmethod
+    def shutdown(self, partial=False):
+        """Remove abandoned cache objects that are not accessed during a compilation.
+        This does not affect jinja2 templates.  Memoized values that have not
+        been used are removed from *.cache/info*, e.g. of deleted entries or
+        vanished pages.  If only `partial` compilation took place, nothing is
+        removed.
+
+        Abandoned intermediates (they accumulate over time) and vanished entries are
+        only dropped from the index.  With a size budget (`max_size`) they are
+        kept and intermediates are evicted by least recent use instead, see
+        :meth:`evict`.  The manifest is written if anything has changed during
+        this run and the pack is compacted when more than `gc_ratio` of it is
+        garbage or it exceeds the budget, see :meth:`compact`."""
+
+        log.debug('cache: %i hits, %i misses in memory' % (self.memory.hits,
+                                                           self.memory.misses))
+        self._stop()
+
+        if not partial:
+            for key in set(self.memoize).difference(self.memoize.used):
+                del self.memoize[key]
 
         # save memoized items to disk
-        try:
-            path = join(self.cache_dir, 'info')
-            self.tracked[path] = set(self.memoize.keys())
-            with io.open(path, 'wb') as fp:
-                pickle.dump(self.memoize, fp, pickle.HIGHEST_PROTOCOL)
-        except (IOError, pickle.PickleError) as e:
-            log.warn('%s: %s' % (e.__class__.__name__, e))
+        if self.memoize != self._memoized:
+            try:
+                path = join(self.cache_dir, 'info')
+                with io.open(path, 'wb') as fp:
+                    pickle.dump(dict(self.memoize), fp, pickle.HIGHEST_PROTOCOL)
+            except (IOError, pickle.PickleError) as e:
+                log.warn('%s: %s' % (e.__class__.__name__, e))
 
-        # first we search for cache files from entries that have vanished
-        for path in set(self._list_dir()).difference(set(self.tracked.keys())):
-            os.remove(path)
+        if partial:
+            pass
+        elif self.max_size:
+            self.evict()
+        else:
+            for path in self.index.keys():
+                for key in set(self.index[path]).difference(self.tracked.get(path, [])):
+                    self._drop(path, key)
+
+        live = sum(v[1] for keys in self.index.itervalues() for v in keys.itervalues())
+
+        if self.garbage and (self.garbage >= self.gc_ratio * (live + self.garbage)
+                             or self.max_size and live + self.garbage > self.max_size):
+            self.compact()
+        elif self.dirty:
+            self._dump()
+
+    @classmethod
+    def evict(self):
+        """Refresh the access time of every intermediate used in this run and
+        drop least recently used intermediates until the cache fits into
+        `max_size`.  Among equally old intermediates, prefixes shared by filter
+        chains are evicted before final outputs."""
 
-        # next we clean the cache files itself
         for path, keys in self.tracked.iteritems():
+            for key in keys.intersection(self.index.get(path, {})):
+                v = self.index[path][key]
+                if v[5] != self.started:
+                    self.index[path][key] = v[:5] + (self.started, )
+                    self.dirty = True
+
+        live = sum(v[1] for keys in self.index.itervalues() for v in keys.itervalues())
+        if live <= self.max_size:
+            return
+
+        for atime, final, path, key in sorted((v[5], v[4], path, key)
+                for path, keys in self.index.iteritems() for key, v in keys.iteritems()):
+            live -= self._drop(path, key)
+            if live <= self.max_size:
+                break
 
-            try:
-                with io.open(path, 'rb') as fp:
-                    obj = pickle.load(fp)
-                    found = set(obj.keys())
-            except (IOError, pickle.PickleError):
-                obj, found = {}, set([])
+    @classmethod
+    def _drop(self, path, key):
+        """Remove a single intermediate from the index and return its size."""
 
-            try:
-                for key in found.difference(set(keys)):
-                    obj.pop(key)
-                with io.open(path, 'wb') as fp:
-                    pickle.dump(obj, fp, pickle.HIGHEST_PROTOCOL)
-            except pickle.PickleError:
-                try:
-                    os.remove(path)
-                except OSError as e:
-                    log.warn('OSError: %s' % e)
-            except IOError:
-                pass
+        size = self.index[path].pop(key)[1]
+        self.objects[path].discard(key)
+        self.memory.pop((path, key))
+        if not self.index[path]:
+            self.index.pop(path)
+            self.objects.pop(path, None)
+
+        self.garbage += size
+        self.dirty = True
+        return size
 
     @classmethod
-    def remove(self, path):
-        """Remove a cache object completely from disk, objects and tracked files."""
+    def compact(self):
+        """Copy every intermediate in the index to a new pack which then replaces
+        the old one.  This is done periodically during `shutdown`, ``acrylamid
+        clean`` does it unconditionally."""
+
+        self.flush()
+        index = defaultdict(dict)
         try:
-            os.remove(path)
-        except OSError as e:
-            log.debug('OSError: %s' % e)
+            fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
+                                       dir=self.cache_dir)
+            with io.open(fd, 'wb') as fp:
+                for path, keys in self.index.iteritems():
+                    for key, v in keys.iteritems():
+                        blob = self._read(path, key)
+                        offset = self._write(fp, path, key, blob, *v[2:5])
+                        index[path][key] = (offset, ) + v[1:]
+            # the manifest describes the old pack, a crash in between rebuilds it
+            if exists(join(self.cache_dir, 'manifest')):
+                os.remove(join(self.cache_dir, 'manifest'))
+            os.rename(tmp, join(self.cache_dir, 'pack'))
+        except (IOError, OSError, pickle.PickleError) as e:
+            log.warn('%s: %s' % (e.__class__.__name__, e))
+            return
+
+        self.index = index
+        self.objects = defaultdict(set, ((p, set(keys)) for p, keys in index.iteritems()))
+        self.garbage = 0
+
+        self._open()
+        self._dump()
+
+    @classmethod
+    def remove(self, path):
+        """Remove a cache object completely from index, objects and tracked files.
+        Its intermediates are dropped from disk on the next `compact`."""
+
+        with self.lock:
+            for key, v in self.index.pop(path, {}).iteritems():
+                self.memory.pop((path, key))
+                self.pending.pop((path, key), None)
+                self.garbage += v[1]
+                self.dirty = True
 
         self.objects.pop(path, None)
         self.tracked.pop(path, None)
 
     @classmethod
     def clear(self):
-        for path in self._list_dir():
+        self.flush()
+        for path in self.index.keys():
             cache.remove(path)
 
+        self.memory.clear()
+        self.memoize.clear()
+
+        if self._pack is not None:
+            self._pack.truncate(0)
+            self.garbage = 0
+            self._dump()
+
     @classmethod
     @track
     def get(self, path, key, default=None, mtime=0.0):
@@ -248,55 +545,175 @@ class cache(object):
         :param mtime: modification timestamp as float value
         """
         try:
-            if mtime > getmtime(path):
+            if mtime > self.index[path][key][2]:
                 cache.remove(path)
                 return default
-            with io.open(path, 'rb') as fp:
-                return zlib.decompress(pickle.load(fp)[key])
-        except (OSError, KeyError):
+
+            # the LRU is not thread-safe, render threads share it
+            with self.lock:
+                rv = self.memory.get((path, key))
+                if rv is None:
+                    if self.index[path][key][0] is None:
+                        rv = self.pending[(path, key)]
+                    else:
+                        decode = self.codecs[self.index[path][key][3]][1]
+                        rv = decode(self._read(path, key))
+                    self.memory[(path, key)] = rv
+            return rv
+        except KeyError:
             pass
-        except (IOError, pickle.PickleError, zlib.error):
+        except (IOError, ValueError, zlib.error):
             cache.remove(path)
 
         return default
 
     @classmethod
     @track
-    def set(self, path, key, value):
-        """Save a key, value pair into a blob using pickle and moderate zlib
-        compression (level 6). We simply save a dictionary containing all
-        different intermediates (from every view) of an entry.
+    def set(self, path, key, value, final=False):
+        """Save a key, value pair into the pack file using the configured codec
+        (moderate zlib compression by default).  Values smaller than `threshold`
+        are stored as is.  Only the new record is written, all other
+        intermediates of this (and every other) entry are left untouched.
 
         :param path: path of this cache object
         :param key: dictionary key where we store the value
-        :param value: a string we compress with zlib and afterwards save
+        :param value: a string we encode and afterwards save
+        :param final: value is the output of a whole filter chain
         """
-        if exists(path):
-            try:
-                with io.open(path, 'rb') as fp:
-                    rv = pickle.load(fp)
-            except (pickle.PickleError, IOError):
-                cache.remove(path)
-                rv = {}
+        try:
+            data = value.encode('utf-8') if isinstance(value, unicode) else value
+            codec = self.codec if len(data) >= self.threshold else 'raw'
+            blob, stamp = self.codecs[codec][0](data), time.time()
+        except (UnicodeError, zlib.error) as e:
+            log.warn('%s: %s' % (e.__class__.__name__, e))
+            return value
+
+        # offset is not known until the record has been written
+        entry = (None, len(blob), stamp, codec, final, self.started)
+
+        with self.lock:
+            if key in self.index[path]:
+                self.garbage += self.index[path][key][1]
+            self.index[path][key] = entry
+            self.objects[path].add(key)
+            self.memory[(path, key)] = data
+            self.dirty = True
+
+            if self.queue is None:
+                self._append(path, key, blob, entry)
+            elif isinstance(self.queue, Batch):
+                # written by the parent process, do not keep a copy around
+                self.queue.put((path, key, blob, entry))
+            else:
+                self.pending[(path, key)] = data
+                self.backlog += len(blob)
+                self.queue.put((path, key, blob, entry))
+
+        if self.max_pending and self.backlog > self.max_pending:
+            self.flush()
+
+        return value
+
+    @classmethod
+    def _append(self, path, key, blob, entry):
+        """Write a record to the pack and point its index entry to it unless it
+        has been replaced or removed in the meantime."""
+
+        with self.lock:
             try:
-                with io.open(path, 'wb') as fp:
-                    rv[key] = zlib.compress(value, 6)
-                    pickle.dump(rv, fp, pickle.HIGHEST_PROTOCOL)
-            except (IOError, pickle.PickleError) as e:
+                offset = self._write(self._pack, path, key, blob, *entry[2:5])
+                if self.queue is None or self.queue.empty():
+                    self._pack.flush()
+            except (IOError, OSError, pickle.PickleError) as e:
                 log.warn('%s: %s' % (e.__class__.__name__, e))
-        else:
+                offset = None
+
+            if self.index.get(path, {}).get(key) is not entry:
+                return
+
+            self.pending.pop((path, key), None)
+            if offset is None:
+                self.index[path].pop(key)
+                self.objects[path].discard(key)
+                self.memory.pop((path, key))
+            else:
+                self.index[path][key] = (offset, ) + entry[1:]
+
+    @classmethod
+    def detach(self):
+        """Prepare a forked worker process: the pack is reopened with its own
+        file offset and new values are collected in a :class:`Batch` instead of
+        being written.  Flush the cache before forking."""
+
+        self._pack = io.open(join(self.cache_dir, 'pack'), 'rb')
+        self.queue, self.writer = Batch(), None
+        self.pending, self.backlog = {}, 0
+        self.lock = threading.RLock()
+        self.max_pending = None
+
+    @classmethod
+    def merge(self, batch):
+        """Write records collected by a detached process into the pack and
+        mark them as used during this run."""
+
+        with self.lock:
+            for path, key, blob, entry in batch:
+                if key in self.index[path]:
+                    self.garbage += self.index[path][key][1]
+                self.index[path][key] = entry
+                self.objects[path].add(key)
+                self.tracked[path].add(key)
+                self.dirty = True
+                self._append(path, key, blob, entry)
+
+    @classmethod
+    def _consume(self, queue):
+        """Writer thread, appends queued records until it receives None."""
+
+        while True:
+            item = queue.get()
             try:
-                fd, tmp = tempfile.mkstemp(suffix=self._fs_transaction_suffix,
-                                           dir=self.cache_dir)
-                with io.open(fd, 'wb') as fp:
-                    pickle.dump({key: zlib.compress(value, 6)}, fp, pickle.HIGHEST_PROTOCOL)
-                os.rename(tmp, path)
-                os.chmod(path, self.mode)
-            except (IOError, OSError, pickle.PickleError, zlib.error) as e:
-                log.warn('%s: %s' % (e.__class__.__name__, e))
+                if item is None:
+                    break
+                self._append(*item)
+                with self.lock:
+                    self.backlog -= len(item[2])
+            finally:
+                queue.task_done()
 
-        self.objects[path].add(key)
-        return value
+    @classmethod
+    def flush(self):
+        """Write all queued values to the pack."""
+
+        if self.queue is None:
+            return
+
+        if self.writer is not None and self.writer.is_alive():
+            self.queue.join()
+        else:
+            while True:
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+                self._append(*item)
+                with self.lock:
+                    self.backlog -= len(item[2])
+                self.queue.task_done()
+
+        with self.lock:
+            self._pack.flush()
+
+    @classmethod
+    def _stop(self):
+        """Flush queued values and stop the writer thread."""
+
+        self.flush()
+        if self.writer is not None:
+            self.queue.put(None)
+            self.writer.join()
+
+        self.queue = self.writer = None
 
     @classmethod
     @track
@@ -305,9 +722,9 @@ class cache(object):
         return key in self.objects[path]
 
     @classmethod
-    @memoized
     def getmtime(self, path, default=0.0):
+        """Return the timestamp of the oldest intermediate of a cache object."""
         try:
-            return getmtime(path)
-        except OSError:
+            return min(v[2] for v in self.index[path].itervalues())
+        except (KeyError, ValueError):
             return default
@@ -170,6 +170,16 @@ conf = default = {
     'filters_ignore': [],
     'filters_include': [],
 
+    'cache_codec': 'zlib',
+    'cache_codec_threshold': 512,
+    'cache_max_size': 0,
+    'cache_memory': 8*1024**2,
+    'cache_write_behind': False,
+    'jobs': 1,
+    'render_threads': 1,
+    'write_threads': 0,
+    'memory_budget': 0,
+
     'filters': ['markdown+codehilite(css_class=highlight)', 'hyphenate'],
     'views': {
     }
@@ -6,16 +6,22 @@
 
 import sys
 import os
+import re
 import glob
 import fnmatch
 
+from collections import defaultdict
+
 from acrylamid import log
+from acrylamid.core import cache
 
 
 def get_filters():
+    """Return the :class:`Manifest` of available filters, filters are imported
+    and initialized when they are looked up by name."""
 
-    global callbacks
-    return callbacks
+    global manifest
+    return manifest
 
 
 def index_filters(module, conf, env):
@@ -36,11 +42,28 @@ def index_filters(module, conf, env):
             callbacks.append(mem)
 
 
+def discover(module):
+    """Return (class name, match) of all filters in the module, regular
+    expressions as (pattern, flags), thus they can be memoized."""
+
+    rv = []
+    for name in dir(module):
+        mem = getattr(module, name)
+        if not name.startswith('_') and isinstance(mem, meta) and hasattr(mem, 'match'):
+            rv.append((name, [m if isinstance(m, basestring) else (m.pattern, m.flags)
+                              for m in mem.match]))
+    return rv
+
+
 def initialize(ext_dir, conf, env, include=[], exclude=[]):
-    """Imports and initializes extensions from the directories in the list
-    specified by 'ext_dir'.  If no such list exists, the we don't load any
-    plugins. 'include' and 'exclude' may contain a list of shell patterns
-    used for fnmatch. If empty, this filter is not applied.
+    """Discovers extensions from the directories in the list specified by
+    'ext_dir'.  If no such list exists, the we don't load any plugins.
+    'include' and 'exclude' may contain a list of shell patterns used for
+    fnmatch. If empty, this filter is not applied.
+
+    The filters (and their names) of each module are memoized by the file's
+    modification time and size, a module is only imported (and its filters
+    initialized) when one of its filters is actually used, see :class:`Manifest`.
 
     :param ext_dir: list of directories
     :param conf: user config
@@ -72,13 +95,13 @@ def initialize(ext_dir, conf, env, include=[], exclude=[]):
         ext_list = []
         for mem in ext_dir:
             files = glob.glob(os.path.join(mem, "*.py"))
-            files = [get_name(f) for f in files
+            files = [(get_name(f), f) for f in files
                                     if pattern(get_name(f), include, exclude)]
             ext_list += files
 
         return sorted(ext_list)
 
-    global plugins
+    global plugins, callbacks, manifest
 
     exclude.extend(['mdx_*', 'rstx_*'])
     ext_dir.extend([os.path.dirname(__file__)])
@@ -90,15 +113,27 @@ def initialize(ext_dir, conf, env, include=[], exclude=[]):
             ext_dir.remove(mem)
             log.error("Filter directory '%s' does not exist. -- skipping" % mem)
 
+    callbacks, manifest = Registry(), Manifest(conf, env)
+
     ext_list = get_extension_list(ext_dir, include, exclude)
-    for mem in ext_list:
-        try:
-            _module = __import__(mem)
-        except (ImportError, Exception), e:
-            log.warn('%r %s: %s', mem, e.__class__.__name__, e)
-            continue
+    for mem, path in ext_list:
+
+        st = os.stat(path)
+        key = 'filter-' + os.path.abspath(path)
 
-        index_filters(_module, conf, env)
+        rv = cache.memoize(key)
+        if rv is None or rv[:2] != (st.st_mtime, st.st_size):
+            try:
+                _module = __import__(mem)
+            except (ImportError, Exception), e:
+                log.warn('%r %s: %s', mem, e.__class__.__name__, e)
+                continue
+
+            rv = (st.st_mtime, st.st_size, discover(_module))
+            cache.memoize(key, rv)
+
+        for name, match in rv[2]:
+            manifest.append(Plugin(mem, name, match))
 
 
 class RegexList(list):
@@ -193,10 +228,134 @@ class FilterList(list):
         return f
 
 
+# inline flags apply to the whole expression, e.g. (?i)
+_inline_re = re.compile(r'\(\?[iLmsux]+\)')
+
+
+class Registry(FilterList):
+    """Available filters.  A filter is looked up by name like in :class:`FilterList`
+    (the first registered filter matching wins), but using an index of all plain
+    names and one alternation of all regular expressions (per flags, usually
+    there is only one).  Expressions with groups (and thus backreferences) or
+    inline flags would change their meaning within the alternation and are
+    matched on their own.  The index is rebuilt after filters have been added,
+    names added to a filter's `match` later on are found by a linear search."""
+
+    def __init__(self, *args, **kwargs):
+        super(Registry, self).__init__(*args, **kwargs)
+        self.index = None
+
+    def append(self, item):
+        super(Registry, self).append(item)
+        self.index = None
+
+    def build(self):
+        """Return a dict of names and a list of (regex, group -> position)."""
+
+        names, patterns, seen = {}, defaultdict(list), set([])
+        regexes = []
+        for i, f in enumerate(self):
+            for value in f.match:
+                if isinstance(value, basestring):
+                    names.setdefault(value, i)
+                elif (value.pattern, value.flags) not in seen:
+                    seen.add((value.pattern, value.flags))
+                    if value.groups or _inline_re.search(value.pattern):
+                        regexes.append((value, {None: i}))
+                    else:
+                        patterns[value.flags].append((value, i))
+
+        # python supports 100 groups per expression
+        chunks = []
+        for flags, values in patterns.iteritems():
+            for j in range(0, len(values), 99):
+                chunks.append((flags, values[j:j+99]))
+
+        for flags, values in chunks:
+            groups = dict(('_%i' % j, i) for j, (value, i) in enumerate(values))
+            try:
+                regex = re.compile('|'.join('(?P<_%i>%s)' % (j, value.pattern)
+                                   for j, (value, i) in enumerate(values)), flags)
+            except (re.error, AssertionError):
+                # fall back to separate expressions
+                regexes.extend((value, {None: i}) for value, i in values)
+            else:
+                regexes.append((regex, groups))
+
+        return names, regexes
+
+    def __getitem__(self, item):
+
+        if self.index is None:
+            self.index = self.build()
+
+        names, regexes = self.index
+        found = [names[item]] if item in names else []
+
+        for regex, groups in regexes:
+            m = regex.match(item)
+            if m is None:
+                continue
+            if None in groups:
+                found.append(groups[None])
+            else:
+                found.extend(groups[k] for k, v in m.groupdict().iteritems()
+                             if v is not None and k in groups)
+
+        if found:
+            return list.__getitem__(self, min(found))
+
+        return super(Registry, self).__getitem__(item)
+
+
+class Plugin(object):
+    """A filter class of a module which has not been imported yet."""
+
+    def __init__(self, module, name, match):
+        self.module, self.name = module, name
+        self.match = RegexList(m if isinstance(m, basestring) else re.compile(*m)
+                               for m in match)
+
+
+class Manifest(Registry):
+    """Available filters as :class:`Plugin`, ordered like they were registered
+    before.  Looking up a filter imports its module and initializes the module's
+    filters (using `conf` and `env`) unless that has been done already.
+
+    Names a filter adds to its `match` during initialization are only found
+    once the filter has been loaded."""
+
+    def __init__(self, conf, env, *args):
+        super(Manifest, self).__init__(*args)
+        self.conf, self.env = conf, env
+        self.loaded = set([])
+
+    def __getitem__(self, item):
+
+        try:
+            plugin = super(Manifest, self).__getitem__(item)
+        except ValueError:
+            return callbacks[item]
+
+        try:
+            module = __import__(plugin.module)
+        except (ImportError, Exception), e:
+            log.warn('%r %s: %s', plugin.module, e.__class__.__name__, e)
+            raise ValueError('%s is not in list' % item)
+
+        if plugin.module not in self.loaded:
+            index_filters(module, self.conf, self.env)
+            self.loaded.add(plugin.module)
+
+        return getattr(module, plugin.name)
+
+
 class Node(dict):
     """This is a root, an edge and a leaf. Stores predecessor and
     count of views using this leaf."""
 
+    __slots__ = ('refs', 'prev')
+
     def __init__(self, *args, **kwargs):
         dict.__init__(self, *args, **kwargs)
         self.refs = 1
@@ -207,14 +366,23 @@ class FilterTree(list):
     """Store all applied filters of an entry in a tree structure to find
     common paths where we can share computed intermediates."""
 
+    __slots__ = ('root', 'views', 'paths')
+
     def __init__(self, *args, **kwargs):
 
         # its a list after all ;-)
         super(FilterTree, self).__init__(*args, **kwargs)
 
-        self.root = Node()
-        self.views = {None: self}
-        self.paths = {None: []}
+        # the tree is planted on first use, most entries share another one
+        self.root = self.views = self.paths = None
+
+    def plant(self):
+        """Create the (empty) tree, if not done yet."""
+
+        if self.root is None:
+            self.root = Node()
+            self.views = {None: self}
+            self.paths = {None: []}
 
     def __iter__(self):
         """Iterating over list of filters of given context."""
@@ -225,6 +393,8 @@ class FilterTree(list):
         """This adds a list of filters and stores the context and the
         reference to that path in self.views."""
 
+        self.plant()
+
         node = self.root
         for key in lst:
             if key not in node:
@@ -241,6 +411,7 @@ class FilterTree(list):
     def path(self, context):
         """Return the actual 'path' a view would use."""
 
+        self.plant()
         return self.paths[context]
 
     def iter(self, context):
@@ -268,4 +439,5 @@ class FilterTree(list):
             yield ls
 
 
-callbacks = FilterList()
+callbacks = Registry()
+manifest = Manifest({}, {})
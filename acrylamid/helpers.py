@@ -9,19 +9,23 @@ import sys
 import os
 import io
 import re
+import codecs
 import hashlib
+import tempfile
 import traceback
+import threading
 import subprocess
 
+from Queue import Queue
 from datetime import datetime
-from collections import defaultdict
-from os.path import join, exists, dirname, basename, getmtime
+from collections import defaultdict, deque
+from os.path import join, exists, dirname, basename
 
 from acrylamid import log
 from acrylamid.errors import AcrylamidException
 
 from acrylamid.core import cache
-from acrylamid.utils import cached_property
+from acrylamid.utils import cached_slot
 from acrylamid.filters import FilterTree
 
 try:
@@ -32,17 +36,92 @@ except ImportError:
 
 try:
     import yaml
+    Loader = getattr(yaml, 'CLoader', yaml.Loader)
+    _constructor = yaml.constructor.Constructor()
 except ImportError:
     yaml = None
 
+# permissions of output files, see _write
+_umask = os.umask(0)
+os.umask(_umask)
+
+# filters are not thread-safe, see FileEntry.content
+_filters_lock = threading.RLock()
+
 _slug_re = re.compile(r'[\t !"#$%&\'()*\-/<=>?@\[\\\]^_`{|},.:]+')
 
 
+# flat "key: value" headers with plain scalars or flow sequences of plain
+# scalars are resolved and constructed like YAML does without parsing it
+_flat_re = re.compile(r'^([A-Za-z_][\w.-]*):(?: +(.*?))? *$')
+_plain_re = re.compile(ur'^[^-?:,\[\]{}#&*!|>\'"%@`\s][^#\x00-\x1f\x7f-\x9f]*$', re.U)
+
+_scalars = set(['tag:yaml.org,2002:' + tag for tag in
+                ('str', 'int', 'float', 'bool', 'null', 'timestamp')])
+
+
+def _scalar(value, flow=False):
+    """Return the plain scalar `value` like yaml.load does or raise ValueError
+    if it is not a plain scalar or something else than a common type."""
+
+    if not _plain_re.match(value) or value.endswith(':') or ': ' in value \
+    or flow and any(c in value for c in ',[]{}:'):
+        raise ValueError(value)
+
+    for tag, regex in Loader.yaml_implicit_resolvers.get(value[0], []):
+        if regex.match(value):
+            break
+    else:
+        tag = 'tag:yaml.org,2002:str'
+
+    if tag not in _scalars:
+        raise ValueError(value)
+
+    return _constructor.yaml_constructors[tag](_constructor, yaml.ScalarNode(tag, value))
+
+
+def _flat(head):
+    """Parse the header lines without YAML if they are flat key-value pairs,
+    otherwise return None."""
+
+    props = {}
+    for line in head:
+        if line.startswith('#') or not line.strip():
+            continue
+
+        match = _flat_re.match(line.rstrip('\n'))
+        if not match:
+            return None
+
+        key, value = match.group(1), match.group(2)
+
+        try:
+            key = _scalar(key)
+            if not value:
+                props[key] = None
+            elif value[0] == '[' and value[-1] == ']':
+                items = [x.strip() for x in value[1:-1].split(',')]
+                props[key] = [_scalar(x, flow=True) for x in items if items != ['']]
+            else:
+                props[key] = _scalar(value)
+        except ValueError:
+            return None
+
+    return props
+
+
+def _newlines(text):
+    """Translate \\r\\n and \\r line endings to \\n like universal newlines."""
+    if '\r' in text:
+        return text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
 def read(filename, encoding, remap={}):
     """Open filename and read content using specified encoding.  It will try
-    to parse the YAML header with yaml.load or fallback (if not available) to
-    a naïve key-value parser. Returns offset where the real content begins and
-    YAML header.
+    to parse the YAML header with yaml.load (unless it contains flat key-value
+    pairs only) or fallback (if not available) to a naïve key-value parser.
+    Returns the byte offset where the real content begins and YAML header.
 
     :param filename: path to an existing text file
     :param encoding: encoding of this file
@@ -63,11 +142,15 @@ def read(filename, encoding, remap={}):
             return unicode(value.strip('"').strip("'"))
 
     head = []
-    i = 0
+    i, offset = 0, 0
 
-    with io.open(filename, 'r', encoding=encoding, errors='replace') as f:
+    with io.open(filename, 'rb') as f:
         while True:
             line = f.readline(); i += 1
+            if not line:
+                break
+            offset += len(line)
+            line = _newlines(line.decode(encoding, 'replace'))
             if i == 1 and line.startswith('---'):
                 pass
             elif i > 1 and not line.startswith('---'):
@@ -77,7 +160,9 @@ def read(filename, encoding, remap={}):
 
     if head and yaml:
         try:
-            props = yaml.load(''.join(head))
+            props = _flat(head)
+            if props is None:
+                props = yaml.load(''.join(head), Loader=Loader)
         except yaml.YAMLError as e:
             raise AcrylamidException('YAMLError: %s' % str(e))
         for key, to in remap.iteritems():
@@ -101,10 +186,122 @@ def read(filename, encoding, remap={}):
                     "your YAML or install PyYAML parser: easy_install -U pyyaml")))
             props[key] = distinguish(value)
 
-    return i, props
+    return offset, props
+
+
+# directives parsed without time.strptime, patterns are identical to _strptime's
+# and _shapes match the same strings with all digits replaced by zero
+_directives = {
+    'd': r"(?P<d>3[0-1]|[1-2]\d|0[1-9]|[1-9]| [1-9])",
+    'H': r"(?P<H>2[0-3]|[0-1]\d|\d)",
+    'M': r"(?P<M>[0-5]\d|\d)",
+    'S': r"(?P<S>6[0-1]|[0-5]\d|\d)",
+    'm': r"(?P<m>1[0-2]|0[1-9]|[1-9])",
+    'Y': r"(?P<Y>\d\d\d\d)",
+    'y': r"(?P<y>\d\d)",
+    '%': '%',
+}
+_shapes = {'d': '(?:00|0| 0)', 'H': '00?', 'M': '00?', 'S': '00?', 'm': '00?',
+           'Y': '0000', 'y': '00', '%': '%'}
+
+_digits = re.compile(r'\d')
+
+# format -> (regex, shape regex) or None, (shape, formats) -> candidates
+_formats, _candidates = {}, {}
+
+
+def _compile(fmt):
+    """Translate a :func:`time.strftime` format into a regular expression like
+    :func:`time.strptime` and a second one matching its shape (see
+    :func:`strptime`).  Returns None if the format contains other directives."""
+
+    if fmt in _formats:
+        return _formats[fmt]
+
+    regex, shape = '', ''
+
+    rest = re.sub(r"([\\.^$*+?\(\){}\[\]|])", r"\\\1", fmt)
+    rest = re.sub(r'\s+', r'\\s+', rest)
+    while '%' in rest:
+        i = rest.index('%')
+        if rest[i+1:i+2] not in _directives:
+            _formats[fmt] = None
+            return None
+        regex += rest[:i] + _directives[rest[i+1]]
+        shape += _digits.sub('0', rest[:i]) + _shapes[rest[i+1]]
+        rest = rest[i+2:]
+
+    regex += rest + r'\Z'
+    shape += _digits.sub('0', rest) + r'\Z'
+
+    _formats[fmt] = re.compile(regex, re.IGNORECASE), re.compile(shape, re.IGNORECASE)
+    return _formats[fmt]
+
+
+def _strptime(string, fmt):
+
+    rv = _compile(fmt)
+    if rv is None:
+        return datetime.strptime(string, fmt)
+
+    match = rv[0].match(string)
+    if match is None:
+        raise ValueError('%r does not match %r' % (string, fmt))
+
+    found = match.groupdict()
+    if 'Y' in found:
+        year = int(found['Y'])
+    elif 'y' in found:
+        year = int(found['y'])
+        year += 2000 if year <= 68 else 1900
+    else:
+        year = 1900
+
+    return datetime(year, int(found.get('m', 1)), int(found.get('d', 1)),
+                    int(found.get('H', 0)), int(found.get('M', 0)), int(found.get('S', 0)))
+
+
+def strptime(string, formats):
+    """Return a :class:`datetime.datetime` parsed from `string` using the first
+    matching format of `formats` -- exactly like trying :func:`datetime.strptime`
+    with each format.  Formats that can not match the shape of the string (its
+    digits replaced by zero) are sorted out once per shape and common
+    directives are parsed using a precompiled regular expression.
+
+    If the preferred (first) format does not match but more than one of the
+    others does with different results, a warning is emitted once per shape."""
+
+    key = (_digits.sub('0', string), tuple(formats))
+
+    try:
+        candidates = _candidates[key]
+    except KeyError:
+        candidates = _candidates[key] = [fmt for fmt in formats if _compile(fmt) is None
+                                         or _compile(fmt)[1].match(key[0])]
+
+        found = []
+        for fmt in candidates:
+            try:
+                found.append((fmt, _strptime(string, fmt)))
+            except ValueError:
+                pass
+        if found and found[0][0] != formats[0] and len(set(d for f, d in found)) > 1:
+            log.once(warn='ambiguous date %r, using %r' % (string, found[0][0]))
+
+    for fmt in candidates:
+        try:
+            return _strptime(string, fmt)
+        except ValueError:
+            pass
+    else:
+        raise ValueError('%r does not match any format' % string)
+
+
+# configuration values used by entries, shared between all entries
+_defaults = {}
 
 
-class FileEntry:
+class FileEntry(object):
     """This class gets it's data and metadata from the file specified
     by the filename argument.
 
@@ -121,25 +318,52 @@ class FileEntry:
         image: /path/to/my/image.png
         ---
 
-    it is available in jinja2 templates as entry.image"""
+    it is available in jinja2 templates as entry.image
+
+    To keep thousands of entries small, attributes are stored in slots, the
+    configuration defaults are shared and the header is not copied (see
+    :attr:`props`)."""
 
     __keys__ = ['permalink', 'date', 'year', 'month', 'day', 'filters', 'tags',
                 'title', 'author', 'content', 'description', 'lang', 'draft',
                 'extension', 'slug']
 
+    __slots__ = ('filename', 'mtime', 'offset', 'props', 'filters', 'context',
+                 '_changed', '_permalink', '_date', '_md5', '_digest', '_description')
+
     def __init__(self, filename, conf):
-        """parsing FileEntry's YAML header."""
+        """parsing FileEntry's YAML header.  The parsed header, the offset of
+        the content, date and permalink are memoized by the file's modification
+        timestamp, size and the relevant configuration, thus an unchanged entry
+        is not opened until its source is actually needed."""
+
+        st = os.stat(filename)
 
         self.filename = filename
-        self.mtime = os.path.getmtime(filename)
-        self.props = dict((k, v) for k, v in conf.iteritems()
-                        if k in ['author', 'lang', 'encoding', 'date_format',
-                                 'permalink_format', 'email'])
+        self.mtime = st.st_mtime
+        self._changed = False
+
+        defaults = tuple(sorted((k, v) for k, v in conf.iteritems()
+                         if k in ['author', 'lang', 'encoding', 'date_format',
+                                  'permalink_format', 'email']))
+        if defaults not in _defaults:
+            _defaults[defaults] = dict(defaults)
 
-        i, props = read(filename, self.props['encoding'],
-                        remap={'tag': 'tags', 'filter': 'filters', 'static': 'draft'})
-        self.offset = i
-        self.props.update(props)
+        stamp = (st.st_mtime, st.st_size, defaults)
+        hkey = 'entry-' + filename
+
+        rv = cache.memoize(hkey)
+        if rv is not None and rv[0] == stamp:
+            self.offset, props, self._date, self._permalink = rv[1:]
+            self.props = Context(_defaults[defaults], props)
+        else:
+            self.offset, props = read(filename, _defaults[defaults]['encoding'],
+                remap={'tag': 'tags', 'filter': 'filters', 'static': 'draft'})
+            self.props = Context(_defaults[defaults], props)
+            cache.memoize(hkey, (stamp, self.offset, props, self.date, self.permalink))
+
+        # keep what is memoized on demand as long as the entry exists
+        cache.memoize.touch('digest-' + filename, 'excerpt-' + filename)
 
         fx = self.props.get('filters', [])
         if isinstance(fx, basestring):
@@ -150,7 +374,7 @@ class FileEntry:
     def __repr__(self):
         return "<FileEntry f'%s'>" % self.filename
 
-    @cached_property
+    @cached_slot
     def permalink(self):
         """Actual permanent link, depends on entry's property and ``permalink_format``.
         If you set permalink in the YAML header, we use this as permalink otherwise
@@ -161,7 +385,7 @@ class FileEntry:
         except KeyError:
             return expand(self.props['permalink_format'].rstrip('index.html'), self)
 
-    @cached_property
+    @cached_slot
     def date(self):
         """return :class:`datetime.datetime` object.  Either converted from given key
         and ``date_format`` or fallback to modification timestamp of the file."""
@@ -181,12 +405,9 @@ class FileEntry:
         string = re.sub(' +', ' ', self.props['date'])
         formats.insert(0, self.props['date_format'])
 
-        for date_format in formats:
-            try:
-                return datetime.strptime(string, date_format)
-            except ValueError:
-                pass
-        else:
+        try:
+            return strptime(string, formats)
+        except ValueError:
             raise AcrylamidException("%r is not a valid date" % string)
 
     @property
@@ -245,9 +466,12 @@ class FileEntry:
 
     @property
     def source(self):
-        with io.open(self.filename, 'r', encoding=self.props['encoding'],
-        errors='replace') as f:
-            return u''.join(f.readlines()[self.offset:]).strip()
+        """The entry's content (without header), read from :attr:`offset` on each
+        access, thus not kept in memory longer than necessary."""
+
+        with io.open(self.filename, 'rb') as fp:
+            fp.seek(self.offset)
+            return _newlines(fp.read().decode(self.props['encoding'], 'replace')).strip()
 
     @property
     def content(self):
@@ -256,80 +480,142 @@ class FileEntry:
         representation and saves final output or intermediates to cache, so
         we can rapidly re-compile the whole content.
 
-        The cache is rather dumb: acrylamid can not determine wether it's
-        abandoned or differs only in a single character. Thus, to minimize
-        the overhead the content is zlib-compressed."""
-
-        # previous value
-        pv = None
+        Intermediates are keyed by the entry's :attr:`digest` and the filters
+        applied so far, thus a touched but otherwise unchanged entry still hits
+        the cache.  To minimize the overhead the content is zlib-compressed."""
 
         # this is our cache filename
         path = join(cache.cache_dir, self.md5)
+        steps = self.steps(self.context)
 
-        # growing dependencies of the filter chain
-        deps = []
-
-        for fxs in self.filters.iter(context=self.context):
-
-            # extend dependencies
-            deps.extend(fxs)
-
-            # key where we save this filter chain
-            key = md5(*deps)
+        # track every intermediate as used and start at the last cached one
+        cached = [cache.has_key(path, key) for fxs, key in steps]
 
-            try:
-                rv = cache.get(path, key, mtime=self.mtime)
-                if rv is None:
+        # previous value
+        pv, start = None, 0
+
+        for i in reversed(range(len(steps))):
+            if cached[i]:
+                pv = cache.get(path, steps[i][1])
+                if pv is not None:
+                    # filters must not depend on where the input comes from
+                    pv, start = pv.decode('utf-8'), i + 1
+                    break
+
+        # pages may be rendered concurrently, but filters are shared
+        with _filters_lock:
+            for i, (fxs, key) in enumerate(steps):
+                if i < start:
+                    continue
+                try:
                     res = self.source if pv is None else pv
                     for f in fxs:
                         res = f.transform(res, self, *f.args)
-                    pv = cache.set(path, key, res)
-                    self.has_changed = True
-                else:
-                    pv = rv
-            except (IndexError, AttributeError):
-                # jinja2 will ignore these Exceptions, better to catch them before
-                traceback.print_exc(file=sys.stdout)
+                    pv = cache.set(path, key, res, final=i == len(steps) - 1)
+                    self._changed = True
+                except (IndexError, AttributeError):
+                    # jinja2 will ignore these Exceptions, better to catch them before
+                    traceback.print_exc(file=sys.stdout)
 
         return pv
 
+    def steps(self, context):
+        """Return the filter chain of `context` split into parts shared with
+        other views as list of (filters, key).  Each part is keyed by its
+        growing dependencies."""
+
+        steps, deps = [], []
+        for fxs in self.filters.iter(context=context):
+            deps.extend(fxs)
+            steps.append((fxs, md5(self.digest, *deps)))
+
+        return steps
+
     @property
     def slug(self):
         """ascii safe entry title"""
         return safeslug(self.title)
 
-    @property
+    @cached_slot
     def description(self):
-        """first 50 characters from the source"""
-        # XXX this is really poor
-        return self.source[:50].strip() + '...'
+        """first 50 characters from the source.  Only the beginning of the content
+        is read and the excerpt is memoized like the header."""
 
-    @cached_property
+        stamp = (self.mtime, os.path.getsize(self.filename), self.offset, self.props['encoding'])
+        hkey = 'excerpt-' + self.filename
+
+        rv = cache.memoize(hkey)
+        if rv is not None and rv[0] == stamp:
+            return rv[1]
+
+        text, decoder = u'', codecs.getincrementaldecoder(self.props['encoding'])('replace')
+        with io.open(self.filename, 'rb') as fp:
+            fp.seek(self.offset)
+            while len(_newlines(text).lstrip()) <= 50:
+                chunk = fp.read(1024)
+                text += decoder.decode(chunk, final=not chunk)
+                if not chunk:
+                    break
+
+        excerpt = _newlines(text).lstrip()[:50].strip() + '...'
+        cache.memoize(hkey, (stamp, excerpt))
+        return excerpt
+
+    @cached_slot
     def md5(self):
         return md5(self.filename, self.title, self.date)
 
+    @cached_slot
+    def digest(self):
+        """MD5 digest of the entry's source including its header.  The file is
+        only read if its modification timestamp or size differs from the
+        previous run, so a fresh checkout or `touch` does not invalidate the
+        cache."""
+
+        stamp = (self.mtime, os.path.getsize(self.filename))
+        hkey = 'digest-' + self.filename
+
+        rv = cache.memoize(hkey)
+        if rv is not None and rv[:2] == stamp:
+            return rv[2]
+
+        h = hashlib.md5()
+        with io.open(self.filename, 'rb') as fp:
+            while True:
+                chunk = fp.read(16384)
+                if not chunk:
+                    break
+                h.update(chunk)
+
+        cache.memoize(hkey, stamp + (h.hexdigest(), ))
+        return h.hexdigest()
+
     @property
     def has_changed(self):
         """Check wether the entry has changed using the following conditions:
 
         - cache file does not exist -> has changed
-        - cache file does not contain required filter intermediate -> has changed
-        - entry's file is newer than the cache's one -> has changed
+        - cache file does not contain required filter intermediate (keyed by
+          the entry's digest) -> has changed
         - otherwise -> not changed
-        """
 
-        path = join(cache.cache_dir, self.md5)
-        deps = []
+        Once the content has been computed (or it is set explicitly), the
+        entry stays changed."""
 
-        for fxs in self.filters.iter(self.context):
+        if self._changed:
+            return True
 
-            # extend filter dependencies
-            deps.extend(fxs)
+        path = join(cache.cache_dir, self.md5)
 
-            if not cache.has_key(path, md5(*deps)):
+        for fxs, key in self.steps(self.context):
+            if not cache.has_key(path, key):
                 return True
         else:
-            return getmtime(self.filename) > cache.getmtime(path)
+            return False
+
+    @has_changed.setter
+    def has_changed(self, value):
+        self._changed = value
 
     def keys(self):
         return list(iter(self))
@@ -349,16 +635,247 @@ def memoize(key, value=None):
     return cache.memoize(key, value)
 
 
+class Context(object):
+    """A read-only, layered view on a list of dictionaries.  Keys are looked up
+    from the last to the first layer, nothing is copied or modified, thus the
+    same base (e.g. `env`) can be shared by pages rendered concurrently.  Like
+    :class:`acrylamid.Environment`, keys are also accessible as attributes."""
+
+    __slots__ = ('_layers', )
+
+    def __init__(self, *layers):
+        object.__setattr__(self, '_layers', layers)
+
+    def __getitem__(self, key):
+        for layer in reversed(self._layers):
+            if key in layer:
+                return layer[key]
+        raise KeyError(key)
+
+    def __getattr__(self, attr):
+        try:
+            return self[attr]
+        except KeyError:
+            raise AttributeError(attr)
+
+    def __setattr__(self, attr, value):
+        raise TypeError('%s is read-only' % self.__class__.__name__)
+
+    __setitem__ = __delitem__ = __setattr__
+
+    def __contains__(self, key):
+        return any(key in layer for layer in self._layers)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(set(key for layer in self._layers for key in layer))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+
+class Recorder(Context):
+    """A :class:`Context` remembering every key looked up, see :class:`graph`."""
+
+    __slots__ = ('_used', )
+
+    def __init__(self, *layers):
+        super(Recorder, self).__init__(*layers)
+        object.__setattr__(self, '_used', set([]))
+
+    def __getitem__(self, key):
+        self._used.add(key)
+        return super(Recorder, self).__getitem__(key)
+
+    def __contains__(self, key):
+        self._used.add(key)
+        return super(Recorder, self).__contains__(key)
+
+
 def union(*args, **kwargs):
-    """Takes a list of dictionaries and performs union of each.  Can take additional
-    key=values as parameters which may overwrite or add a key/value-pair."""
+    """Takes a list of dictionaries and returns their union as read-only
+    :class:`Context`.  Can take additional key=values as parameters which may
+    overwrite or add a key/value-pair.  None of the arguments is modified."""
+
+    return Context(*(args + (kwargs, )))
+
+
+class graph(object):
+    """Dependencies of generated files: the template, the entries (by the key
+    of their filter chain which covers source and filters), the configuration
+    keys read while rendering and additional values of the view (e.g.
+    pagination).  They are saved alongside the digest of the file, see
+    :func:`mkfile`, thus a view regenerates a file only if one of its inputs
+    has changed -- without comparing entry lists or rendering it at all.
+
+    .. code-block:: python
+
+        if not graph.changed(path, tt, entries, self.conf, prev, next):
+            event.skip(path)
+            continue
+
+        html = partial(tt.render, conf=graph.track(path), ...)
+
+    This class is a singleton and should not be initialized."""
+
+    # every page depends on these keys, e.g. via env.path
+    implicit = ('www_root', )
+
+    # path -> (template, entries, extra, recording conf) of pages to write
+    pending = {}
+
+    # (entry filenames, output paths) to restrict a compilation to
+    targets = None
+
+    def __init__(self):
+        raise AcrylamidException('Not Implemented')
+
+    @staticmethod
+    def _hash(value):
+        return hashlib.md5(repr(value)).hexdigest()
+
+    @classmethod
+    def changed(self, path, tt, entries, conf, *extra, **kwargs):
+        """Return True if `path` does not exist or any of its inputs has
+        changed since it has been written.  Must be called before the page
+        is rendered, see :meth:`track`.  With `targets` set, pages neither
+        listed nor containing a targeted entry are never changed.
+
+        A page rendering only a few attributes of its entries (but not their
+        content) passes them as `fields`, e.g. ``fields=('title', 'date')``."""
+
+        if self.targets is not None:
+            files, paths = self.targets
+            if path not in paths and not any(e.filename in files for e in entries):
+                return False
+
+        fields = kwargs.get('fields')
+
+        tokens = []
+        for entry in entries:
+            if fields:
+                values = [getattr(entry, field) for field in fields]
+                tokens.append((entry.filename, self._hash(values)))
+                continue
+
+            steps = entry.steps(entry.context)
+            tokens.append((entry.filename, steps[-1][1] if steps else entry.digest))
+
+            # a skipped page does not read the content, but its intermediates
+            # are still used and must not be dropped by cache.shutdown
+            for fxs, key in steps:
+                cache.has_key(join(cache.cache_dir, entry.md5), key)
+
+        deps = (tt.name, tuple(tokens), self._hash(extra))
+        self.pending[path] = deps + (Recorder(conf), )
+
+        rv = memoize('output-' + path)
+        if rv is None or len(rv) < 4 or rv[3] is None:
+            return True
+
+        if tt.has_changed or rv[3][:3] != deps or not exists(path):
+            return True
+
+        for key, value in rv[3][3]:
+            if self._hash(conf.get(key, None)) != value:
+                return True
+
+        del self.pending[path]
+        return False
+
+    @classmethod
+    def track(self, path):
+        """Return the configuration for the template of `path`, it records all
+        keys accessed during rendering."""
+        return self.pending[path][3]
+
+    @classmethod
+    def commit(self, path):
+        """Remove and return the dependencies of `path` as they are saved."""
+
+        try:
+            tt, tokens, extra, conf = self.pending.pop(path)
+        except KeyError:
+            return None
 
-    d = args[0]
-    for dikt in args[1:]:
-        d.update(dict)
+        keys = sorted(conf._used.union(self.implicit))
+        return tt, tokens, extra, tuple((k, self._hash(conf.get(k, None))) for k in keys)
 
-    d.update(kwargs)
-    return d
+
+def _write(content, path, force=False, dryrun=False):
+    """Write `content` to `path` unless the file is identical and return the
+    name of the event to report, see :func:`mkfile`.
+
+    The digest, size and mtime of every written file are memoized together
+    with its dependencies (see :class:`graph`), thus an unchanged file is
+    detected by its stat without reading it.  Files are written to a temporary
+    file first and renamed, a crashed compilation never leaves partially
+    written files."""
+
+    data = content.encode('utf-8') if isinstance(content, unicode) else content
+    digest = hashlib.md5(data).hexdigest()
+    deps = graph.commit(path)
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+
+    if st is not None and not force:
+        stamp = (digest, st.st_size, st.st_mtime)
+        rv = memoize('output-' + path)
+
+        # not written by us (or modified elsewhere), compare once
+        if (rv is None or rv[:3] != stamp) and st.st_size == len(data):
+            with io.open(path, 'rb') as fp:
+                if fp.read() == data:
+                    rv = stamp
+
+        if rv is not None and rv[:3] == stamp:
+            if not dryrun:
+                memoize('output-' + path, stamp + (deps, ))
+            return 'identical'
+
+    if dryrun:
+        return 'create' if st is None else 'update'
+
+    try:
+        os.makedirs(dirname(path))
+    except OSError:
+        # dir already exists (mostly)
+        pass
+
+    fd, tmp = tempfile.mkstemp(dir=dirname(path), prefix='.' + basename(path))
+    try:
+        with io.open(fd, 'wb') as fp:
+            fp.write(data)
+        os.chmod(tmp, 0666 & ~_umask)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        os.remove(tmp)
+        raise
+
+    rv = 'create' if st is None else 'update'
+
+    st = os.stat(path)
+    memoize('output-' + path, (digest, st.st_size, st.st_mtime, deps))
+
+    return rv
+
+
+def _report(name, path, ctime):
+    if name == 'identical':
+        event.identical(path)
+    else:
+        getattr(event, name)(path=path, ctime=ctime)
 
 
 def mkfile(content, path, ctime=0.0, force=False, dryrun=False, **kwargs):
@@ -370,28 +887,90 @@ def mkfile(content, path, ctime=0.0, force=False, dryrun=False, **kwargs):
     :param force: force overwrite, even nothing has changed (defaults to `False`)
     :param dryrun: don't write anything."""
 
-    # XXX use hashing for comparison
-    if exists(dirname(path)) and exists(path):
-        with io.open(path, 'r') as fp:
-            old = fp.read()
-        if content == old and not force:
-            event.identical(path)
-        else:
-            if not dryrun:
-                with io.open(path, 'w') as fp:
-                    fp.write(content)
-            event.update(path=path, ctime=ctime)
-    else:
-        try:
-            if not dryrun:
-                os.makedirs(dirname(path))
-        except OSError:
-            # dir already exists (mostly)
-            pass
-        if not dryrun:
-            with io.open(path, 'w') as fp:
-                fp.write(content)
-        event.create(path=path, ctime=ctime)
+    _report(_write(content, path, force, dryrun), path, ctime)
+
+
+class Writer(object):
+    """Writes files like :func:`mkfile` in `threads` background threads, thus
+    rendering and disk I/O overlap.  At most `size` files (and with `budget` set,
+    not more than that many bytes) are queued, :meth:`put` blocks if the
+    writers fall behind.  Events are reported in the order files
+    have been put and always from the calling thread.  Without threads, files
+    are written immediately.
+
+    Exceptions raised while writing are re-raised on the next :meth:`put`,
+    :meth:`wait` or :meth:`close`."""
+
+    def __init__(self, threads=0, size=64, budget=None, force=False, dryrun=False, **kwargs):
+
+        self.force, self.dryrun = force, dryrun
+        self.queue, self.jobs = Queue(size), deque()
+        self.threads = []
+
+        # size of files not reported yet
+        self.budget, self.queued = budget, 0
+
+        for i in range(threads):
+            t = threading.Thread(target=self._consume)
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def _consume(self):
+
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                job['rv'] = _write(job.pop('content'), job['path'], self.force, self.dryrun)
+            except Exception:
+                job['rv'] = sys.exc_info()
+            finally:
+                if job is not None:
+                    job['done'].set()
+                self.queue.task_done()
+
+    def _report(self, block=False):
+        """Report finished files in order, wait for all if `block` is set."""
+
+        while self.jobs and (block or self.jobs[0]['done'].is_set()):
+            job = self.jobs.popleft()
+            job['done'].wait()
+            self.queued -= job['size']
+            if isinstance(job['rv'], tuple):
+                raise job['rv'][0], job['rv'][1], job['rv'][2]
+            _report(job['rv'], job['path'], job['ctime'])
+
+    def put(self, content, path, ctime=0.0):
+
+        if not self.threads:
+            return _report(_write(content, path, self.force, self.dryrun), path, ctime)
+
+        self._report()
+        while self.budget and self.jobs and self.queued + len(content) > self.budget:
+            self.jobs[0]['done'].wait()
+            self._report()
+
+        job = {'content': content, 'path': path, 'ctime': ctime,
+               'size': len(content), 'done': threading.Event()}
+        self.queued += job['size']
+        self.jobs.append(job)
+        self.queue.put(job)
+
+    def wait(self):
+        """Block until all queued files are written and reported."""
+        self._report(block=True)
+
+    def close(self):
+
+        for t in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+
+        self.threads = []
+        self._report(block=True)
 
 
 def md5(*objs,  **kw):
@@ -442,15 +1021,14 @@ def safeslug(slug):
     return unicode('-'.join(result))
 
 
-def paginate(list, ipp, func=lambda x: x, salt=None, orphans=0):
-    """Yields a triple (index, list of entries, has changed) of a paginated
-    entrylist.  It will first filter by the specified function, then split the
-    ist into several sublists and check wether the list or an entry has changed.
+def pages(list, ipp, func=lambda x: x, orphans=0):
+    """Yields a tuple (index, list of entries) of a paginated entrylist.  It
+    will first filter by the specified function and then split the list into
+    several sublists.  Whether a page has changed is up to :class:`graph`.
 
     :param list: the entrylist containing FileEntry instances.
     :param ipp: items per page
     :param func: filter list of entries by this function
-    :param salt: uses as additional identifier in memoize
     :param orphans: avoid N orphans on last page.
     """
 
@@ -471,12 +1049,29 @@ def paginate(list, ipp, func=lambda x: x, salt=None, orphans=0):
         curr = i
         prev = None if i >= j else i+1
 
+        yield (next, curr, prev), entries
+
+
+def paginate(list, ipp, func=lambda x: x, salt=None, orphans=0):
+    """Yields a triple (index, list of entries, has changed) of a paginated
+    entrylist, see :func:`pages`, and checks wether the list or an entry has
+    changed.  Built-in views use :func:`pages` and :class:`graph` instead.
+
+    :param list: the entrylist containing FileEntry instances.
+    :param ipp: items per page
+    :param func: filter list of entries by this function
+    :param salt: uses as additional identifier in memoize
+    :param orphans: avoid N orphans on last page.
+    """
+
+    for (next, curr, prev), entries in pages(list, ipp, func, orphans):
+
         # get caller, so we can set a unique and meaningful hash-key
         frame = log.findCaller()
         if salt is None:
-            hkey = '%s:%s-hash-%i' % (basename(frame[0]), frame[2], i)
+            hkey = '%s:%s-hash-%i' % (basename(frame[0]), frame[2], curr)
         else:
-            hkey = '%s:%s-hash-%s-%i' % (basename(frame[0]), frame[2], salt, i)
+            hkey = '%s:%s-hash-%s-%i' % (basename(frame[0]), frame[2], salt, curr)
 
         # calculating hash value and retrieve memoized value
         hv = md5(*entries, attr=lambda o: o.md5)
@@ -591,6 +1186,8 @@ class event:
             log.info("update  %s", path)
 
     def skip(self, path):
+        # the output is still there, so is what we know about it
+        cache.memoize.touch('output-' + path)
         log.skip("skip  %s", path)
 
     def identical(self, path):
@@ -9,7 +9,7 @@ from fnmatch import fnmatch
 from optparse import make_option
 
 from acrylamid import log, commands
-from acrylamid.helpers import event
+from acrylamid.core import cache
 
 aliases = ('clean', 'rm')
 usage = "%prog " + sys.argv[1] + " [-fn]"
@@ -57,12 +57,15 @@ def run(conf, env, args, force=False, dryrun=True, **options):
     - you can use --dry-run to see what would have been removed
     - by default acrylamid does NOT call this function
     - it removes silently every empty directory
+    - it compacts the cache
 
     :param conf: user configuration
     :param env: acrylamid environment
     :param force: remove all tracked files, too
     :param dryrun: don't delete, just show what would have been done
     """
+    from acrylamid.helpers import event
+
     # we don't bother the user here
     log.setLevel(env.options.verbosity+5)
     env.options.ignore = True
@@ -73,6 +76,10 @@ def run(conf, env, args, force=False, dryrun=True, **options):
     # run a silent compile
     commands.compile(conf, env, dryrun=True, force=False)
 
+    # and reclaim space of abandoned cache objects
+    if not dryrun:
+        cache.compact()
+
     log.setLevel(env.options.verbosity)
 
     global tracked
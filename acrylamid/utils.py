@@ -62,6 +62,30 @@ class cached_property(object):
         return value
 
 
+class cached_slot(object):
+    """Like :class:`cached_property` but for classes using `__slots__`: the
+    value is stored in the slot named like the function with a leading
+    underscore, which has to be listed in `__slots__`.  Assigning the slot
+    beforehand skips the computation."""
+
+    def __init__(self, func, name=None, doc=None):
+        self.__name__ = name or func.__name__
+        self.__module__ = func.__module__
+        self.__doc__ = doc or func.__doc__
+        self.func = func
+        self.slot = '_' + self.__name__
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.func(obj)
+            setattr(obj, self.slot, value)
+            return value
+
+
 class memoized(object):
    """Decorator. Caches a function's return value each time it is called.
    If called later with the same arguments, the cached value is returned
@@ -89,6 +113,79 @@ class memoized(object):
       return functools.partial(self.__call__, obj)
 
 
+class LRU(object):
+    """A bounded mapping which discards the least recently used items as soon
+    as the total length of its values exceeds `capacity`.  Hits and misses
+    of :meth:`get` are counted.
+
+    >>> x = LRU(capacity=10)
+    >>> x['foo'] = 'Hello World!'
+    >>> x.get('foo')
+    None
+    """
+
+    def __init__(self, capacity=0):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        # doubly linked list of [prev, next, key, value], oldest first
+        self.root = root = []
+        root[:] = [root, root, None, None]
+        self.map = {}
+        self.size = 0
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.map)
+
+    def __contains__(self, key):
+        return key in self.map
+
+    def __setitem__(self, key, value):
+
+        self.pop(key)
+        if len(value) > self.capacity:
+            return
+
+        root = self.root
+        link = [root[0], root, key, value]
+        root[0][1] = root[0] = self.map[key] = link
+        self.size += len(value)
+
+        while self.size > self.capacity:
+            self.pop(root[1][2])
+
+    def get(self, key, default=None):
+
+        link = self.map.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+
+        # move to most recently used position
+        prev, next = link[0], link[1]
+        prev[1], next[0] = next, prev
+
+        root = self.root
+        link[0], link[1] = root[0], root
+        root[0][1] = root[0] = link
+
+        self.hits += 1
+        return link[3]
+
+    def pop(self, key, default=None):
+
+        link = self.map.pop(key, None)
+        if link is None:
+            return default
+
+        prev, next = link[0], link[1]
+        prev[1], next[0] = next, prev
+        self.size -= len(link[3])
+        return link[3]
+
+
 def filelist(content_dir, entries_ignore=[]):
     """Gathering all entries in content_dir except entries_ignore via fnmatch."""
 
@@ -10,6 +10,7 @@ import glob
 import traceback
 
 from acrylamid import log
+from acrylamid.core import cache
 from acrylamid.errors import AcrylamidException
 
 # module-wide callbacks variable contaning views, reset this on initialize!
@@ -65,7 +66,18 @@ def index_views(module, urlmap, conf, env):
             urlmap.remove((view, rule))
 
 
+def discover(module):
+    """Return the names :func:`index_views` may find in module, which are all of
+    its attributes, not only subclasses of :class:`View`."""
+
+    return dir(module)
+
+
 def initialize(ext_dir, conf, env):
+    """Import and initialize the views used in `conf['views']` from the
+    directories in `ext_dir`.  The attribute names of each module are memoized
+    by the file's modification time and size, thus only modules providing one
+    of the configured views are imported (once they are known)."""
 
     global __views_list
     __views_list = []
@@ -85,21 +97,53 @@ def initialize(ext_dir, conf, env):
             log.error("View directory %r does not exist. -- skipping" % mem)
 
     for mem in ext_dir:
-        files = glob.glob(os.path.join(mem, "*.py"))
-        files += [p.rstrip('/__init__.py') for p in \
+        files = [(os.path.basename(p).replace('.py', ''), p) for p in \
+                    glob.glob(os.path.join(mem, "*.py"))]
+        files += [(os.path.basename(os.path.dirname(p)), p) for p in \
                     glob.glob(os.path.join(mem, '*/__init__.py'))]
         ext_list += files
 
-    for mem in [os.path.basename(x).replace('.py', '') for x in ext_list]:
+    # module -> names of its attributes
+    modules = []
+    for mem, path in ext_list:
         if mem.startswith('_'):
             continue
+
+        st = os.stat(path)
+        key = 'view-' + os.path.abspath(path)
+
+        rv = cache.memoize(key)
+        if rv is None or rv[:2] != (st.st_mtime, st.st_size):
+            try:
+                rv = (st.st_mtime, st.st_size, discover(__import__(mem)))
+            except (ImportError, Exception), e:
+                log.error('%r ImportError %r', mem, e)
+                traceback.print_exc(file=sys.stdout)
+                continue
+            cache.memoize(key, rv)
+
+        modules.append((mem, set(rv[2])))
+
+    # like index_views, the first module providing a view wins
+    for mem, names in modules:
+        rules = [(view, rule) for view, rule in urlmap if names.intersection(
+                 [view, view.capitalize(), view.lower(), view.upper()])]
+        if not rules:
+            continue
+
+        # index_views removes the rules it has mapped, others are left to
+        # the next module providing the view
+        found = rules[:]
         try:
             _module = __import__(mem)
-            #sys.modules[__package__].__dict__[mem] = _module
-            index_views(_module, urlmap, conf, env)
+            index_views(_module, rules, conf, env)
         except (ImportError, Exception), e:
             log.error('%r ImportError %r', mem, e)
             traceback.print_exc(file=sys.stdout)
+        finally:
+            for rule in found:
+                if rule not in rules:
+                    urlmap.remove(rule)
 
 
 class View(object):
@@ -3,13 +3,17 @@
 
 from acrylamid.views import View
 
-from acrylamid.helpers import union, joinurl, event, md5, memoize
+from acrylamid.helpers import union, joinurl, event, graph
 
-from os.path import exists
+from functools import partial
 
 
 class Articles(View):
-    """Generates a overview of all articles."""
+    """Generates a overview of all articles.  The page is only regenerated if
+    the title, date or permalink of an article changes (or the template), a
+    template rendering anything else of an entry must list it in `fields`."""
+
+    fields = ('title', 'date', 'permalink')
 
     def generate(self, request):
 
@@ -19,17 +23,7 @@ class Articles(View):
         tt = self.env.jinja2.get_template('articles.html')
         path = joinurl(self.conf['output_dir'], self.path, 'index.html')
 
-        hv = md5(*entrylist, attr=lambda o: o.md5)
-        rv = memoize('articles-hash')
-
-        if rv == hv:
-            has_changed = False
-        else:
-            # save new value for next run
-            memoize('articles-hash', hv)
-            has_changed = True
-
-        if exists(path) and not has_changed and not tt.has_changed:
+        if not graph.changed(path, tt, entrylist, self.conf, fields=self.fields):
             event.skip(path)
             raise StopIteration
 
@@ -37,7 +31,7 @@ class Articles(View):
         for entry in entrylist:
             articles.setdefault((entry.year, entry.month), []).append(entry)
 
-        html = tt.render(conf=self.conf, articles=articles,
-                         env=union(self.env, num_entries=len(entrylist)))
+        html = partial(tt.render, conf=graph.track(path), articles=articles,
+                       env=union(self.env, num_entries=len(entrylist)))
 
         yield html, path
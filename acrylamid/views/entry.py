@@ -1,10 +1,10 @@
 # Copyright 2012 posativ <info@posativ.org>. All rights reserved.
 # License: BSD Style, 2 clauses. see acrylamid/__init__.py
 
-from os.path import exists
+from functools import partial
 
 from acrylamid.views import View
-from acrylamid.helpers import expand, union, joinurl, event
+from acrylamid.helpers import expand, union, joinurl, event, graph
 from acrylamid.errors import AcrylamidException
 
 class Entry(View):
@@ -32,11 +32,11 @@ class Entry(View):
             pathes[p] = entry
 
         for path, entry in pathes.iteritems():
-            if exists(path) and not entry.has_changed and not tt.has_changed:
+            if not graph.changed(path, tt, [entry], self.conf):
                 event.skip(path)
                 continue
 
-            html = tt.render(env=union(self.env, entrylist=[entry], type='entry'),
-                             conf=self.conf, entry=entry)
+            html = partial(tt.render, env=union(self.env, entrylist=[entry], type='entry'),
+                           conf=graph.track(path), entry=entry)
 
             yield html, path
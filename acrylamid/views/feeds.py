@@ -3,10 +3,10 @@
 # -*- encoding: utf-8 -*-
 
 from datetime import datetime
-from os.path import exists
+from functools import partial
 
 from acrylamid.views import View
-from acrylamid.helpers import joinurl, event, union
+from acrylamid.helpers import joinurl, event, union, graph
 
 
 class Feed(View):
@@ -21,14 +21,13 @@ class Feed(View):
             path = joinurl(path, 'index.html')
 
 
-        if exists(path) and not filter(lambda e: e.has_changed, entrylist):
-            if not tt.has_changed:
-                event.skip(path)
-                raise StopIteration
+        if not graph.changed(path, tt, entrylist, self.conf):
+            event.skip(path)
+            raise StopIteration
 
         updated=entrylist[0].date if entrylist else datetime.now()
-        html = tt.render(conf=self.conf, env=union(self.env,
-                         updated=updated, entrylist=entrylist))
+        html = partial(tt.render, conf=graph.track(path), env=union(self.env,
+                       updated=updated, entrylist=entrylist))
 
         yield html, path
 
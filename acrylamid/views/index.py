@@ -2,10 +2,10 @@
 # License: BSD Style, 2 clauses. see acrylamid/__init__.py
 # -*- encoding: utf-8 -*-
 
-from os.path import exists
+from functools import partial
 
 from acrylamid.views import View
-from acrylamid.helpers import union, joinurl, event, paginate, expand
+from acrylamid.helpers import union, joinurl, event, pages, expand, graph
 
 
 class Index(View):
@@ -24,9 +24,9 @@ class Index(View):
         tt = self.env.jinja2.get_template('main.html')
 
         entrylist = [entry for entry in request['entrylist'] if not entry.draft]
-        paginator = paginate(entrylist, ipp, orphans=self.conf['default_orphans'])
+        paginator = pages(entrylist, ipp, orphans=self.conf['default_orphans'])
 
-        for (next, curr, prev), entries, has_changed in paginator:
+        for (next, curr, prev), entries in paginator:
             # curr = current page, next = newer pages, prev = older pages
 
             if next is not None:
@@ -37,12 +37,12 @@ class Index(View):
             prev = None if prev is None else expand(self.pagination, {'num': prev})
             path = joinurl(self.conf['output_dir'], curr, 'index.html')
 
-            if exists(path) and not has_changed and not tt.has_changed:
+            if not graph.changed(path, tt, entries, self.conf, prev, next, len(entrylist)):
                 event.skip(path)
                 continue
 
-            html = tt.render(conf=self.conf, env=union(self.env, entrylist=entries,
-                                  type='index', prev=prev, curr=curr, next=next,
-                                  items_per_page=ipp, num_entries=len(entrylist)))
+            html = partial(tt.render, conf=graph.track(path), env=union(self.env, entrylist=entries,
+                           type='index', prev=prev, curr=curr, next=next,
+                           items_per_page=ipp, num_entries=len(entrylist)))
 
             yield html, path
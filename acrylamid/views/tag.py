@@ -6,11 +6,11 @@
 import math
 import random
 
-from os.path import exists
+from functools import partial
 from collections import defaultdict
 
 from acrylamid.views import View
-from acrylamid.helpers import union, joinurl, safeslug, event, paginate, expand
+from acrylamid.helpers import union, joinurl, safeslug, event, pages, expand, graph
 
 
 class Tagcloud:
@@ -90,9 +90,9 @@ class Tag(View):
         for tag in self.tags:
 
             entrylist = [entry for entry in self.tags[tag]]
-            paginator = paginate(entrylist, ipp, salt=tag, orphans=self.conf['default_orphans'])
+            paginator = pages(entrylist, ipp, orphans=self.conf['default_orphans'])
 
-            for (next, curr, prev), entries, has_changed in paginator:
+            for (next, curr, prev), entries in paginator:
 
                 # e.g.: curr = /page/3, next = /page/2, prev = /page/4
 
@@ -111,12 +111,12 @@ class Tag(View):
 
                 path = joinurl(self.conf['output_dir'], curr, 'index.html')
 
-                if exists(path) and not has_changed and not tt.has_changed:
+                if not graph.changed(path, tt, entries, self.conf, prev, next, len(entrylist)):
                     event.skip(path)
                     continue
 
-                html = tt.render(conf=self.conf, env=union(self.env, entrylist=entries,
-                                type='tag', prev=prev, curr=curr, next=next,
-                                items_per_page=ipp, num_entries=len(entrylist)))
+                html = partial(tt.render, conf=graph.track(path), env=union(self.env, entrylist=entries,
+                               type='tag', prev=prev, curr=curr, next=next,
+                               items_per_page=ipp, num_entries=len(entrylist)))
 
                 yield html, path
@@ -11,6 +11,9 @@ import os
 from os.path import join, isfile, isdir
 
 from acrylamid import Environment, log
+from acrylamid.core import cache
+from acrylamid.helpers import event
+from acrylamid.errors import AcrylamidException
 from acrylamid.commands import initialize, compile
 from acrylamid.defaults import conf
 
@@ -148,6 +151,120 @@ class TestMultipleEntries(unittest.TestCase):
         self.assertEqual(open('output/2012/foo/index.html').read(), expected)
         self.assertEqual(open('output/2012/bar/index.html').read(), expected)
 
+    def test_graph(self):
+        with open('content/foo.txt', 'wb') as fp:
+            fp.write(entry(title='Foo'))
+        with open('content/bar.txt', 'wb') as fp:
+            fp.write(entry(title='Bar'))
+
+        # files not skipped
+        rendered = []
+        track = lambda path, *args, **kw: rendered.append(path)
+        event.register(track, to=['create', 'update', 'identical'])
+
+        # conf is shared with the other tests
+        state = dict((k, self.conf[k]) for k in ('sitename', 'www_root') if k in self.conf)
+
+        try:
+            compile(self.conf, self.env)
+            self.assertEqual(len(rendered), 3)
+
+            # nothing has changed
+            del rendered[:]
+            compile(self.conf, self.env)
+            self.assertEqual(rendered, [])
+
+            # only pages containing bar
+            with open('content/bar.txt', 'ab') as fp:
+                fp.write('\nMore.')
+            compile(self.conf, self.env)
+            self.assertEqual(sorted(rendered), ['output/2012/bar/index.html', 'output/atom.xml'])
+
+            # the templates do not use any configuration value
+            del rendered[:]
+            self.conf['sitename'] = 'Spam'
+            compile(self.conf, self.env)
+            self.assertEqual(rendered, [])
+
+            # ... but every page depends on www_root
+            self.conf['www_root'] = 'http://example.org/'
+            compile(self.conf, self.env)
+            self.assertEqual(len(rendered), 3)
+        finally:
+            for name in ('create', 'update', 'identical'):
+                event.callbacks[name].remove(track)
+            for k in ('sitename', 'www_root'):
+                self.conf.pop(k, None)
+            self.conf.update(state)
+
+    def test_noop(self):
+        for title in 'Foo', 'Bar':
+            with open('content/%s.txt' % title.lower(), 'wb') as fp:
+                fp.write(entry(title=title))
+
+        compile(self.conf, self.env)
+        index = dict((path, sorted(keys)) for path, keys in cache.index.iteritems())
+
+        # skipped pages still use the intermediates of their entries
+        compile(self.conf, self.env)
+        self.assertEqual(dict((path, sorted(keys)) for path, keys in cache.index.iteritems()),
+                         index)
+        self.assertEqual(cache.garbage, 0)
+
+    def test_targets(self):
+        for title in 'Foo', 'Bar':
+            with open('content/%s.txt' % title.lower(), 'wb') as fp:
+                fp.write(entry(title=title))
+
+        rendered = []
+        track = lambda path, *args, **kw: rendered.append(path)
+        event.register(track, to=['create', 'update', 'identical'])
+
+        try:
+            compile(self.conf, self.env)
+            for title in 'foo', 'bar':
+                with open('content/%s.txt' % title, 'ab') as fp:
+                    fp.write('\nMore.')
+
+            del rendered[:]
+            compile(self.conf, self.env, targets=['content/foo.txt'])
+            self.assertEqual(sorted(rendered), ['output/2012/foo/index.html', 'output/atom.xml'])
+
+            del rendered[:]
+            compile(self.conf, self.env, targets=['/2012/bar'])
+            self.assertEqual(rendered, ['output/2012/bar/index.html'])
+
+            self.assertRaises(AcrylamidException, compile, self.conf, self.env,
+                              targets=['/2012/baz/'])
+        finally:
+            for name in ('create', 'update', 'identical'):
+                event.callbacks[name].remove(track)
+
+    def test_concurrent(self):
+        for i in range(8):
+            with open('content/%i.txt' % i, 'wb') as fp:
+                fp.write(entry(title='Entry %i' % i))
+
+        def read():
+            return dict((join(root, fn), open(join(root, fn)).read())
+                        for root, dirs, files in os.walk('output/') for fn in files)
+
+        compile(self.conf, self.env, options)
+        expected = read()
+        shutil.rmtree('output/')
+
+        self.conf['jobs'], self.conf['render_threads'] = 2, 4
+        compile(self.conf, self.env, options)
+        self.assertEqual(read(), expected)
+
+        # render threads read cached outputs and evict each other's values
+        shutil.rmtree('output/')
+        self.conf['cache_memory'] = 512
+        compile(self.conf, self.env, options)
+        self.assertEqual(read(), expected)
+
     def tearDown(self):
+        self.conf['jobs'], self.conf['render_threads'] = 1, 1
+        self.conf['cache_memory'] = 8*1024**2
         os.chdir('../')
         shutil.rmtree(self.path)
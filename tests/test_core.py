@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+import sys; reload(sys)
+sys.setdefaultencoding('utf-8')
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest # NOQA
+
+from os.path import join
+
+from acrylamid import log
+from acrylamid.core import cache
+from acrylamid.errors import AcrylamidException
+
+log.init('acrylamid', level=40)
+
+
+def detached(args):
+    path, key = args
+    cache.set(path, key, cache.get(path, 'foo') + ' ' + key)
+    return list(cache.queue), len(cache.pending), cache.backlog
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache_dir = cache.cache_dir
+        cache.init(join(self.path, '.cache/'))
+        self.obj = join(cache.cache_dir, 'a'*32)
+
+    def tearDown(self):
+        cache.cache_dir = self.cache_dir
+        cache.codec, cache.threshold, cache.max_size = 'zlib', 0, None
+        cache.write_behind, cache.max_pending = False, None
+        shutil.rmtree(self.path)
+
+    def test_roundtrip(self):
+
+        self.assertEqual(cache.get(self.obj, 'foo'), None)
+        self.assertEqual(cache.set(self.obj, 'foo', 'Hello World'), 'Hello World')
+        self.assertEqual(cache.set(self.obj, 'bar', 'Spam'), 'Spam')
+
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'bar'), 'Spam')
+        self.assertTrue(cache.has_key(self.obj, 'foo'))
+        self.assertFalse(cache.has_key(self.obj, 'baz'))
+
+        # re-initialize from pack file
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'bar'), 'Spam')
+
+    def test_mtime(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        cache.set(self.obj, 'bar', 'Spam')
+
+        self.assertEqual(cache.get(self.obj, 'foo', mtime=0.0), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'foo', mtime=time.time()+1), None)
+
+        # whole object is invalid now
+        self.assertFalse(cache.has_key(self.obj, 'bar'))
+
+    def test_shutdown(self):
+
+        other = join(cache.cache_dir, 'b'*32)
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        cache.set(self.obj, 'bar', 'Spam')
+        cache.set(other, 'foo', 'Ham')
+
+        # next run uses obj:foo only
+        cache.init()
+        cache.get(self.obj, 'foo')
+        cache.shutdown()
+
+        # two of three intermediates are abandoned, thus compacted
+        self.assertEqual(cache.garbage, 0)
+
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertFalse(cache.has_key(self.obj, 'bar'))
+        self.assertFalse(cache.has_key(other, 'foo'))
+
+    def test_truncated(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        size = os.path.getsize(join(cache.cache_dir, 'pack'))
+        cache.set(self.obj, 'bar', 'Spam')
+
+        with open(join(cache.cache_dir, 'pack'), 'r+b') as fp:
+            fp.truncate(size + 5)
+
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'bar'), None)
+        self.assertEqual(os.path.getsize(join(cache.cache_dir, 'pack')), size)
+
+    def test_manifest(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        cache.get(self.obj, 'foo')
+        cache.shutdown()
+
+        # appended after the manifest has been written
+        cache.set(self.obj, 'bar', 'Spam')
+
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'bar'), 'Spam')
+
+        # corrupt manifest is rebuilt from the pack
+        with open(join(cache.cache_dir, 'manifest'), 'wb') as fp:
+            fp.write('garbage')
+
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'bar'), 'Spam')
+
+    def test_dirty(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        cache.shutdown()
+
+        manifest = join(cache.cache_dir, 'manifest')
+        os.utime(manifest, (1000, 1000))
+
+        # nothing has changed, nothing is written
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        cache.shutdown()
+
+        self.assertEqual(os.path.getmtime(manifest), 1000)
+
+        # a few bytes of garbage do not trigger a compaction
+        cache.init()
+        cache.set(self.obj, 'foo', 'Hello World' * 10)
+        cache.set(self.obj, 'bar', 'Spam')
+        cache.shutdown()
+
+        self.assertTrue(cache.garbage > 0)
+        self.assertNotEqual(os.path.getmtime(manifest), 1000)
+
+        cache.init()
+        self.assertTrue(cache.garbage > 0)
+        cache.compact()
+        self.assertEqual(cache.garbage, 0)
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World' * 10)
+
+    def test_codecs(self):
+
+        cache.init(codec='zlib', threshold=100)
+        cache.set(self.obj, 'small', 'Hello World')
+        cache.set(self.obj, 'large', 'Hello World' * 100)
+
+        self.assertEqual(cache.index[self.obj]['small'][3], 'raw')
+        self.assertEqual(cache.index[self.obj]['large'][3], 'zlib')
+        self.assertTrue(cache.index[self.obj]['large'][1] < 1100)
+
+        # switching codecs does not invalidate existing values
+        cache.init(codec='raw')
+        cache.set(self.obj, 'other', 'Hello World' * 100)
+
+        self.assertEqual(cache.get(self.obj, 'small'), 'Hello World')
+        self.assertEqual(cache.get(self.obj, 'large'), 'Hello World' * 100)
+        self.assertEqual(cache.get(self.obj, 'other'), 'Hello World' * 100)
+        self.assertEqual(cache.index[self.obj]['other'][1], 1100)
+
+        self.assertRaises(AcrylamidException, cache.init, codec='foo')
+
+    def test_budget(self):
+
+        cache.init(codec='raw', max_size=250)
+        cache.set(self.obj, 'old', 'x' * 100, final=True)
+        cache.shutdown()
+
+        # next run, 'old' is not used but kept
+        cache.init()
+        cache.started = cache.started + 10
+        cache.set(self.obj, 'prefix', 'x' * 100)
+        cache.set(self.obj, 'final', 'x' * 100, final=True)
+        cache.shutdown()
+
+        self.assertEqual(sorted(cache.index[self.obj]), ['final', 'prefix'])
+
+        # prefixes are evicted before final outputs
+        cache.init()
+        cache.started = cache.started + 20
+        cache.get(self.obj, 'prefix')
+        cache.get(self.obj, 'final')
+        cache.set(self.obj, 'another', 'x' * 100, final=True)
+        cache.shutdown()
+
+        self.assertEqual(sorted(cache.index[self.obj]), ['another', 'final'])
+        self.assertTrue(os.path.getsize(join(cache.cache_dir, 'pack')) < 250 + 200)
+
+    def test_memory(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+        cache.init()
+
+        self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual((cache.memory.hits, cache.memory.misses), (0, 1))
+
+        # served from memory, even if the pack vanishes
+        cache._pack.truncate(0)
+        for i in range(3):
+            self.assertEqual(cache.get(self.obj, 'foo'), 'Hello World')
+        self.assertEqual((cache.memory.hits, cache.memory.misses), (3, 1))
+
+        cache.remove(self.obj)
+        self.assertEqual(cache.get(self.obj, 'foo'), None)
+
+    def test_threads(self):
+
+        capacity = cache.memory.capacity
+        for i in range(200):
+            cache.set(self.obj, str(i), 'Hello World %03i' % i)
+
+        def worker(seed):
+            for i in range(2000):
+                key = str((i * 7 + seed) % 200)
+                self.assertEqual(cache.get(self.obj, key), 'Hello World %03i' % int(key))
+
+        try:
+            # a few entries only, thus render threads evict each other's values
+            cache.init(memory=15 * 20)
+            threads = [threading.Thread(target=worker, args=(i, )) for i in range(8)]
+            for t in threads:
+                t.daemon = True
+                t.start()
+            for t in threads:
+                t.join(30)
+                self.assertFalse(t.is_alive())
+
+            memory, link, n = cache.memory, cache.memory.root[1], 0
+            while link is not memory.root:
+                link, n = link[1], n + 1
+            self.assertEqual(n, len(memory))
+            self.assertEqual(memory.size, sum(len(l[3]) for l in memory.map.itervalues()))
+            self.assertTrue(memory.size <= memory.capacity)
+        finally:
+            cache.memory.capacity = capacity
+
+    def test_write_behind(self):
+
+        for mode in (True, 'shutdown'):
+
+            cache.init(write_behind=mode)
+            for i in range(100):
+                cache.set(self.obj, str(i), 'Hello World %i' % i)
+
+            self.assertEqual(cache.get(self.obj, '42'), 'Hello World 42')
+            cache.memory.clear()
+            self.assertEqual(cache.get(self.obj, '23'), 'Hello World 23')
+
+            cache.shutdown()
+            self.assertEqual(cache.pending, {})
+            self.assertEqual(cache.writer, None)
+
+            cache.init(write_behind=False)
+            for i in range(100):
+                self.assertEqual(cache.get(self.obj, str(i)), 'Hello World %i' % i)
+            cache.clear()
+
+    def test_max_pending(self):
+
+        cache.init(codec='raw', write_behind='shutdown', max_pending=250)
+        for i in range(10):
+            cache.set(self.obj, str(i), 'x' * 100)
+            self.assertTrue(cache.backlog <= 250)
+
+        self.assertTrue(len(cache.pending) < 3)
+        cache.init(write_behind=False, max_pending=0)
+        self.assertEqual(cache.get(self.obj, '7'), 'x' * 100)
+
+    def test_memoize(self):
+
+        cache.memoize.clear()
+        cache.memoize('entry-foo', 1)
+        cache.memoize('entry-bar', 2)
+        cache.memoize('output-baz', 3)
+        cache.shutdown()
+
+        # a partial compilation keeps what it did not use
+        cache.init()
+        self.assertEqual(cache.memoize('entry-foo'), 1)
+        cache.shutdown(partial=True)
+
+        cache.memoize.clear()
+        cache.init()
+        self.assertEqual(cache.memoize('entry-bar'), 2)
+
+        # ... a full one keeps used keys only
+        cache.init()
+        cache.memoize('entry-foo')
+        cache.memoize.touch('output-baz')
+        cache.shutdown()
+
+        cache.memoize.clear()
+        cache.init()
+        self.assertEqual(sorted(cache.memoize), ['entry-foo', 'output-baz'])
+
+    def test_loader(self):
+
+        from acrylamid.core import ExtendedFileSystemLoader
+        from acrylamid.templates import ExtendedFileSystemLoader as Loader
+
+        self.assertTrue(isinstance(ExtendedFileSystemLoader(self.path), Loader))
+
+    def test_detach(self):
+
+        cache.set(self.obj, 'foo', 'Hello World')
+
+        pool = multiprocessing.Pool(2, initializer=cache.detach)
+        results = pool.map(detached, [(self.obj, 'bar'), (self.obj, 'baz')])
+        pool.close()
+        pool.join()
+
+        # workers do not keep uncompressed copies of their records
+        batches = [batch for batch, pending, backlog in results]
+        self.assertEqual([(pending, backlog) for batch, pending, backlog in results],
+                         [(0, 0), (0, 0)])
+
+        # nothing has been written by the workers
+        self.assertFalse(cache.has_key(self.obj, 'bar'))
+
+        for batch in batches:
+            cache.merge(batch)
+
+        self.assertEqual(cache.get(self.obj, 'bar'), 'Hello World bar')
+        cache.init()
+        self.assertEqual(cache.get(self.obj, 'baz'), 'Hello World baz')
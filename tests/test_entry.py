@@ -8,10 +8,11 @@ try:
 except ImportError:
     import unittest # NOQA
 
+import os
 import tempfile
 from datetime import datetime
 
-from acrylamid import log, errors
+from acrylamid import log, errors, helpers
 from acrylamid.helpers import FileEntry, escape
 from acrylamid.defaults import conf
 
@@ -108,3 +109,85 @@ class TestFileEntry(unittest.TestCase):
         self.assertEquals(entry.year, datetime.now().year)
         self.assertEquals(entry.month, datetime.now().month)
         self.assertEquals(entry.day, datetime.now().day)
+
+    def test_digest(self):
+
+        create(self.path, title='foo')
+        digest = FileEntry(self.path, conf).digest
+
+        # touch does not change the digest
+        os.utime(self.path, (1000, 1000))
+        self.assertEquals(FileEntry(self.path, conf).digest, digest)
+
+        create(self.path, title='bar')
+        os.utime(self.path, (2000, 2000))
+        self.assertNotEquals(FileEntry(self.path, conf).digest, digest)
+
+    def test_header_index(self):
+
+        create(self.path, title='foo', date='13.02.2011, 15:36')
+        entry = FileEntry(self.path, conf)
+        self.assertEquals(entry.title, 'foo')
+
+        # an unchanged entry is not read again
+        read, helpers.read = helpers.read, None
+        try:
+            entry = FileEntry(self.path, conf)
+            self.assertEquals((entry.title, entry.offset), ('foo', os.path.getsize(self.path)))
+            self.assertEquals(entry.date, datetime(2011, 2, 13, 15, 36))
+        finally:
+            helpers.read = read
+
+        create(self.path, title='bar', date='13.02.2011, 15:36')
+        os.utime(self.path, (2000, 2000))
+        self.assertEquals(FileEntry(self.path, conf).title, 'bar')
+
+    def test_read(self):
+
+        try:
+            import yaml
+        except ImportError:
+            return
+
+        headers = ['title: Hello World\ndate: 2012-01-01\ntags: [Foo, Bar Baz]\n',
+                   'date: 2012-01-01 12:00:00\ndraft: off\nn: 012\n# comment\n\n',
+                   'title: foo, bar\nurl: http://example.org/\ntags: []\nfoo:\n',
+                   'title: "quoted"\n', 'title: foo # bar\n', 'title: a:b\n',
+                   'tags:\n  - Foo\n  - Bar\n', 'title: ÄÖÜ\ntags: [Äh, 2.5]\n']
+
+        for header in headers:
+            with open(self.path, 'w') as fp:
+                fp.write('---\n' + header + '---\n')
+            self.assertEquals(helpers.read(self.path, 'utf-8')[1],
+                              yaml.load(header.decode('utf-8'), Loader=yaml.Loader))
+
+    def test_source(self):
+
+        for body in ['\n\nHello World\n', '\r\n' * 600 + 'Ümlauts ' * 300,
+                     'Short  \r\n\r\n  ', '']:
+
+            with open(self.path, 'w') as fp:
+                fp.write('---\r\ntitle: Ä\r\n---\r\n' + body)
+
+            expected = body.decode('utf-8').replace('\r\n', '\n').strip()
+
+            entry = FileEntry(self.path, conf)
+            self.assertEquals(entry.title, u'Ä')
+            self.assertEquals(entry.source, expected)
+            self.assertEquals(entry.description, expected[:50].strip() + '...')
+
+    def test_compact(self):
+
+        create(self.path, title='foo', image='/img/foo.png')
+        entry, other = FileEntry(self.path, conf), FileEntry(self.path, conf)
+
+        self.assertFalse(hasattr(entry, '__dict__'))
+        self.assertEquals((entry.title, entry['image']), ('foo', '/img/foo.png'))
+        self.assertRaises(AttributeError, setattr, entry, 'image', None)
+
+        # configuration defaults are shared
+        self.assertEquals(entry.author, 'Anonymous')
+        self.assertTrue(entry.props._layers[0] is other.props._layers[0])
+
+        entry.has_changed = True
+        self.assertTrue(entry.has_changed)
@@ -6,9 +6,13 @@ except ImportError:
     import unittest # NOQA
 
 import sys
+import os
 import re
+import shutil
+import tempfile
 
-from acrylamid.filters import FilterList
+from acrylamid import filters
+from acrylamid.filters import FilterList, Registry
 from acrylamid.filters import Filter
 
 
@@ -69,3 +73,93 @@ class TestFilters(unittest.TestCase):
         self.assertEqual(x['sp'], f3)
         self.assertEqual(x['spam'], f3)
         self.assertEqual(x['sPaMmEr'], f3)
+
+    def test_plan(self):
+
+        from acrylamid.commands import plan
+
+        f1 = build('F1', match=['F1'], conflicts=['F2'], priority=10.0)
+        f2 = build('F2', match=['F2'])
+        f3 = build('F3', match=['F3'], priority=70.0)
+
+        ns, chains = {'F1': f1, 'F2': f2, 'F3': f3}, {}
+
+        chain = plan(('F1', 'F2', 'F3', 'F1'), ns, chains)
+        self.assertEqual(chain, [f3, f1])
+
+        # planned once, shared afterwards
+        self.assertTrue(plan(('F1', 'F2', 'F3', 'F1'), ns, chains) is chain)
+        self.assertEqual(plan(('F2', 'F1'), ns, chains), [f2])
+
+    def test_Registry(self):
+
+        filters = [build('F1', match=['foo', re.compile('^ba(r|z)$')]),
+                   build('F2', match=[re.compile('^Ba', re.I), 'spam']),
+                   build('F3', match=['bar', re.compile('^(?P<x>eggs)$')]),
+                   build('F4', match=[re.compile('^spam$'), re.compile('^e')])]
+
+        registry = Registry(filters)
+        for name in ('foo', 'bar', 'baz', 'BAZ', 'bam', 'spam', 'eggs', 'e', 'x'):
+            try:
+                expected = FilterList(filters)[name]
+            except ValueError:
+                self.assertRaises(ValueError, registry.__getitem__, name)
+            else:
+                self.assertEqual(registry[name], expected)
+
+        # names added later are found as well
+        filters[3].match.append('ham')
+        self.assertEqual(registry['ham'], filters[3])
+
+        registry.append(build('F5', match=['new']))
+        self.assertEqual(registry['new'].name, 'F5')
+
+        # more expressions than groups per expression
+        registry = Registry(build('R%i' % i, match=[re.compile('^r(?:%i)$' % i)])
+                            for i in range(150))
+        self.assertEqual(registry['r149'].name, 'R149')
+
+        # backreferences and inline flags keep their meaning
+        filters = [build('B1', match=[re.compile('^x+$')]),
+                   build('B2', match=[re.compile(r'^(a|b)\1$')]),
+                   build('B3', match=[re.compile('^ab$'), re.compile('(?i)^y$')]),
+                   build('B4', match=[re.compile('^[a-z]+$')])]
+
+        registry = Registry(filters)
+        for name in ('aa', 'ab', 'ba', 'y', 'Y', 'X', 'xx'):
+            try:
+                expected = FilterList(filters)[name]
+            except ValueError:
+                self.assertRaises(ValueError, registry.__getitem__, name)
+            else:
+                self.assertEqual(registry[name], expected)
+        self.assertEqual(registry['aa'].name, 'B2')
+
+    def test_Manifest(self):
+
+        path = tempfile.mkdtemp()
+        with open(os.path.join(path, 'lazyfx.py'), 'w') as fp:
+            fp.write('from acrylamid.filters import Filter\n\n'
+                     'class Lazy(Filter):\n    match = ["lazy", "Lazy"]\n'
+                     '    def init(self, conf, env):\n        self.conf = conf\n')
+
+        state = filters.callbacks, filters.manifest
+        try:
+            # modules are imported once to discover their filters
+            filters.initialize([path], {}, {}, include=['lazyfx'])
+            del sys.modules['lazyfx']
+
+            filters.initialize([path], {'foo': 'bar'}, {}, include=['lazyfx'])
+            self.assertFalse('lazyfx' in sys.modules)
+
+            # imported and initialized on first use
+            fx = filters.get_filters()['Lazy']
+            self.assertEqual((fx.__name__, fx.conf), ('Lazy', {'foo': 'bar'}))
+            self.assertTrue('lazyfx' in sys.modules)
+            self.assertRaises(ValueError, filters.get_filters().__getitem__, 'eager')
+        finally:
+            filters.callbacks, filters.manifest = state
+            while path in sys.path:
+                sys.path.remove(path)
+            sys.modules.pop('lazyfx', None)
+            shutil.rmtree(path)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest # NOQA
+
+from os.path import join, dirname, abspath
+
+# modules a lightweight subcommand should not import
+heavy = ['jinja2', 'yaml', 'multiprocessing', 'urllib2', 'acrylamid.helpers',
+         'acrylamid.filters', 'acrylamid.views', 'acrylamid.lib.importer']
+
+script = """
+import sys; sys.argv = %r
+try:
+    import acrylamid; acrylamid.Acryl()
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(m for m in sys.modules if sys.modules[m]))
+"""
+
+
+class TestStartup(unittest.TestCase):
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+        os.mkdir(join(self.path, '.cache'))
+        with open(join(self.path, 'conf.py'), 'w') as fp:
+            fp.write("DEPLOYMENT = {'echo': 'echo'}\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def modules(self, *args):
+        """Return the modules imported by `acrylamid *args`."""
+
+        env = dict(os.environ, PYTHONPATH=dirname(dirname(abspath(__file__))))
+        p = subprocess.Popen([sys.executable, '-c', script % (['acrylamid'] + list(args))],
+                             cwd=self.path, env=env, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        return set(err.split())
+
+    def test_lightweight(self):
+
+        for args in (['--version'], ['help'], ['deploy', 'echo', '-q'], ['rm', '--help']):
+            self.assertEqual(self.modules(*args).intersection(heavy), set([]), args)
+
+    def test_new(self):
+
+        # reading the entry back requires helpers and YAML, nothing else
+        modules = self.modules('new', '-q', 'Hello', 'World')
+        self.assertEqual(modules.intersection(heavy), set(['yaml', 'acrylamid.helpers',
+                                                           'acrylamid.filters']))
+        self.assertTrue(os.listdir(join(self.path, 'content')))
@@ -3,7 +3,11 @@
 import sys; reload(sys)
 sys.setdefaultencoding('utf-8')
 
+import os
 import shutil
+import tempfile
+
+from datetime import datetime
 
 try:
     import unittest2 as unittest
@@ -14,6 +18,7 @@ from acrylamid import log
 from acrylamid.core import cache
 from acrylamid import helpers
 from acrylamid import AcrylamidException
+from acrylamid.utils import LRU
 
 class TestUtils(unittest.TestCase):
 
@@ -100,6 +105,10 @@ class TestUtils(unittest.TestCase):
             [((None, 1, 2), res[:10], True), ((1, 2, 3), res[10:20], True),
              ((2, 3, None), res[20:], True)])
 
+        # pagination only, changes are up to graph
+        self.assertEqual(list(helpers.pages(res, 10)),
+            [((None, 1, 2), res[:10]), ((1, 2, 3), res[10:20]), ((2, 3, None), res[20:])])
+
         # edge cases
         self.assertEqual(list(helpers.paginate([], 2)), [])
         self.assertEqual(list(helpers.paginate([], 2, orphans=7)), [])
@@ -126,3 +135,136 @@ class TestUtils(unittest.TestCase):
             helpers.system('bc', '1+1')
         with self.assertRaises(OSError):
             helpers.system('foo', None)
+
+    def test_strptime(self):
+
+        formats = ['%d.%m.%Y, %H:%M', '%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M',
+                   '%Y-%m-%d', '%Y/%m/%d', '%d-%m-%Y', '%Y-%d-%m', '%d/%m/%Y',
+                   '%d.%m.%Y', '%d.%m.%Y %H:%M', '%Y-%m-%d %H:%M:%S',
+                   '%y%m%d', '%B %d, %Y', '%Y-%m-%dT%H:%M:%S%%']
+
+        def reference(string):
+            for fmt in formats:
+                try:
+                    return datetime.strptime(string, fmt)
+                except ValueError:
+                    pass
+
+        for string in ('13.12.2012, 23:42', '1.1.2012, 1:2', '2012-12-13 23:42',
+                       '2012/1/2 3:04', '2012-01-02', '2012-13-02', '2012-02-30',
+                       '13-12-2012', '24/12/2012', '24.12.2012', '24.12.2012 23:42',
+                       '2012-12-24 23:42:59', '2012-12-24 23:42:60', '121224',
+                       'December 24, 2012', 'december 24, 2012', '2012-12-24T23:42:59%',
+                       ' 1.1.2012, 1:2', '1.1.2012 , 1:2', '2012-1-2x', '', 'foo'):
+
+            expected = reference(string)
+            for i in range(2):
+                if expected is None:
+                    self.assertRaises(ValueError, helpers.strptime, string, formats)
+                else:
+                    self.assertEqual(helpers.strptime(string, formats), expected)
+
+    def test_union(self):
+
+        env = {'foo': 1, 'bar': 2}
+        ctx = helpers.union(env, {'bar': 3}, spam=4)
+
+        self.assertEqual((ctx['foo'], ctx.bar, ctx.spam), (1, 3, 4))
+        self.assertEqual(sorted(ctx), ['bar', 'foo', 'spam'])
+        self.assertEqual(ctx.get('ham'), None)
+        self.assertFalse('ham' in ctx)
+
+        # neither the arguments nor the context are modified
+        self.assertEqual(env, {'foo': 1, 'bar': 2})
+        self.assertRaises(TypeError, setattr, ctx, 'foo', 42)
+        self.assertRaises(AttributeError, getattr, ctx, 'ham')
+
+    def test_mkfile(self):
+
+        path = tempfile.mkdtemp()
+        events = []
+        track = lambda name: lambda path, *args, **kw: events.append(name)
+        callbacks = [(name, track(name)) for name in ('create', 'update', 'identical')]
+        for name, callback in callbacks:
+            helpers.event.register(callback, to=[name])
+
+        try:
+            fn = os.path.join(path, 'foo', 'index.html')
+
+            helpers.mkfile(u'Hello World', fn)
+            helpers.mkfile(u'Hello World', fn)
+            helpers.mkfile(u'Hello Spam!', fn)
+            self.assertEqual(events, ['create', 'identical', 'update'])
+
+            # modified elsewhere, but same content
+            os.utime(fn, (1000, 1000))
+            helpers.mkfile(u'Hello Spam!', fn)
+            with open(fn, 'w') as fp:
+                fp.write('Hello Eggs!')
+            helpers.mkfile(u'Hello Spam!', fn)
+            self.assertEqual(events[3:], ['identical', 'update'])
+
+            self.assertEqual(open(fn).read(), 'Hello Spam!')
+            self.assertEqual(os.listdir(os.path.dirname(fn)), ['index.html'])
+        finally:
+            for name, callback in callbacks:
+                helpers.event.callbacks[name].remove(callback)
+            shutil.rmtree(path)
+
+    def test_writer(self):
+
+        path = tempfile.mkdtemp()
+        events = []
+        track = lambda path, *args, **kw: events.append(path)
+        helpers.event.register(track, to=['create', 'update', 'identical'])
+
+        try:
+            files = [os.path.join(path, str(i % 7), '%i.html' % i) for i in range(50)]
+
+            writer = helpers.Writer(threads=4, size=2)
+            for i, fn in enumerate(files):
+                writer.put(u'Hello World %i' % i, fn)
+            writer.close()
+
+            self.assertEqual(events, files)
+            for i, fn in enumerate(files):
+                self.assertEqual(open(fn).read(), 'Hello World %i' % i)
+
+            # not more than budget bytes are queued
+            writer = helpers.Writer(threads=4, budget=40)
+            for i, fn in enumerate(files):
+                writer.put(u'Hello World %i!' % i, fn)
+                self.assertTrue(writer.queued <= 40)
+            writer.close()
+
+            self.assertEqual(events, files * 2)
+            self.assertEqual(open(files[-1]).read(), 'Hello World 49!')
+
+            # errors are raised in the calling thread
+            writer = helpers.Writer(threads=2)
+            writer.put(u'Hello World', files[0] + '/foo')
+            self.assertRaises((IOError, OSError), writer.close)
+        finally:
+            for name in ('create', 'update', 'identical'):
+                helpers.event.callbacks[name].remove(track)
+            shutil.rmtree(path)
+
+    def test_lru(self):
+
+        lru = LRU(capacity=10)
+        lru['foo'] = '12345'
+        lru['bar'] = '123'
+
+        self.assertEqual(lru.get('foo'), '12345')
+        lru['baz'] = '1234'
+
+        self.assertTrue('foo' in lru)
+        self.assertFalse('bar' in lru)
+        self.assertEqual((lru.size, len(lru)), (9, 2))
+
+        # too large values are not stored at all
+        lru['spam'] = 'x' * 11
+        self.assertFalse('spam' in lru)
+
+        self.assertEqual(lru.get('bar'), None)
+        self.assertEqual((lru.hits, lru.misses), (1, 1))
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import shutil
+import tempfile
+
+try:
+    import unittest2 as unittest
+except ImportError:
+    import unittest # NOQA
+
+from acrylamid import log, views
+
+log.init('acrylamid', level=40)
+
+
+class TestViews(unittest.TestCase):
+
+    def setUp(self):
+
+        self.path = tempfile.mkdtemp()
+        for name in ('lazyview', 'otherview'):
+            with open(os.path.join(self.path, name + '.py'), 'w') as fp:
+                fp.write('from acrylamid.views import View\n\n'
+                         'class %s(View):\n    pass\n' % name.replace('view', '').title())
+
+    def tearDown(self):
+
+        while self.path in sys.path:
+            sys.path.remove(self.path)
+        for name in ('lazyview', 'otherview', 'brokenview', 'duckview'):
+            sys.modules.pop(name, None)
+        shutil.rmtree(self.path)
+
+    def test_initialize(self):
+
+        try:
+            self.assertIn
+        except AttributeError:
+            self.assertIn = lambda x, y: self.assertTrue(x in y)
+            self.assertNotIn = lambda x, y: self.assertFalse(x in y)
+
+        conf = {'views': {'/': {'view': 'lazy'}, '/foo/': {'view': 'LAZY'}}}
+
+        # modules are imported once to discover their views
+        views.initialize([self.path], conf, {})
+        self.assertEqual(len(views.get_views()), 2)
+
+        for name in ('lazyview', 'otherview'):
+            del sys.modules[name]
+
+        # ... and later on only if they provide one of the used views
+        views.initialize([self.path], conf, {})
+        self.assertIn('lazyview', sys.modules)
+        self.assertNotIn('otherview', sys.modules)
+
+        self.assertEqual(sorted(v.path for v in views.get_views()), ['/', '/foo/'])
+        self.assertEqual(set(type(v).__name__ for v in views.get_views()), set(['Lazy']))
+
+    def test_fallback(self):
+
+        other = tempfile.mkdtemp()
+        with open(os.path.join(other, 'brokenview.py'), 'w') as fp:
+            fp.write('from acrylamid.views import View\n\n'
+                     'class Lazy(View):\n    def init(self):\n        1/0\n')
+
+        # views exposed as something else than a subclass of View
+        with open(os.path.join(self.path, 'duckview.py'), 'w') as fp:
+            fp.write('from acrylamid.views import View\n\n'
+                     'def duck(conf, env, **kwargs):\n'
+                     '    return View(conf, env, **kwargs)\n')
+
+        conf = {'views': {'/': {'view': 'lazy'}, '/duck/': {'view': 'duck'}}}
+
+        try:
+            # a view failing in the first module is looked up in the next one
+            views.initialize([other, self.path], conf, {})
+            self.assertEqual(sorted((type(v).__name__, v.__module__, v.path)
+                                    for v in views.get_views()),
+                             [('Lazy', 'lazyview', '/'), ('View', 'acrylamid.views', '/duck/')])
+        finally:
+            while other in sys.path:
+                sys.path.remove(other)
+            shutil.rmtree(other)